@@ -0,0 +1,170 @@
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import leaderboards
+
+# durability modes:
+#   sync        - write and commit every event immediately (the old behaviour)
+#   batch       - buffer events, block the caller if the queue is full
+#   best_effort - buffer events, drop them if the queue is full
+DURABILITY_MODES = ('sync', 'batch', 'best_effort')
+
+FLUSH = object()
+STOP = object()
+
+
+class ActivityLogger:
+    """Background writer for search and viewedProduct events
+
+    Events are queued by the interactive code and written by a worker
+    thread with executemany, one transaction per batch. A batch is
+    written when batch_size events are waiting, when flush_interval
+    seconds have passed since the first of them, or on flush()/close().
+    Events buffered in memory are lost if the process dies, use
+    durability='sync' if that matters.
+    """
+
+    def __init__(self, db, batch_size=100, flush_interval=1.0,
+                 max_queue=10000, durability='best_effort'):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability must be one of {DURABILITY_MODES}")
+
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+
+        # Counters
+        self.lock = threading.Lock()
+        self.flushed = 0
+        self.dropped = 0
+        self.batches = 0
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.worker = None
+        if durability != 'sync':
+            self.worker = threading.Thread(
+                target=self.run, name="activity-log", daemon=True
+            )
+            self.worker.start()
+
+    def log_search(self, cid, session_no, query):
+        self.log(('search', cid, session_no, datetime.now().isoformat(), query))
+
+    def log_view(self, cid, session_no, pid):
+        self.log(('view', cid, session_no, datetime.now().isoformat(), pid))
+
+    def log(self, event):
+        if self.durability == 'sync':
+            self.write([event])
+        elif self.durability == 'batch':
+            self.queue.put(event)
+        else:
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                self.count(dropped=1)
+
+    def flush(self):
+        """Write everything queued so far and wait until it is committed"""
+        if self.worker is None or not self.worker.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put((FLUSH, done))
+        done.wait()
+
+    def close(self):
+        if self.worker is not None and self.worker.is_alive():
+            self.queue.put(STOP)
+            self.worker.join()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+                'batches': self.batches,
+                'queued': self.queue.qsize(),
+            }
+
+    def count(self, flushed=0, dropped=0, batches=0):
+        with self.lock:
+            self.flushed += flushed
+            self.dropped += dropped
+            self.batches += batches
+
+    def run(self):
+        batch = []
+        deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                # flush_interval has passed since the first buffered event
+                item = None
+
+            if item is STOP:
+                self.write(batch)
+                return
+
+            if item is None or item[0] is FLUSH:
+                self.write(batch)
+                batch = []
+                deadline = None
+                if item is not None:
+                    item[1].set()
+                continue
+
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+                deadline = None
+
+    def write(self, events):
+        """Insert a batch of events in one transaction"""
+        if not events:
+            return
+
+        searches = [event[1:] for event in events if event[0] == 'search']
+        views = [event[1:] for event in events if event[0] == 'view']
+
+        try:
+            with self.db.transaction() as conn:
+                self.insert(conn, searches, views)
+            self.count(flushed=len(events), batches=1)
+        except sqlite3.Error:
+            # One bad event (e.g. a session that doesn't exist) fails the whole
+            # executemany, so retry one at a time and drop only the bad ones
+            for event in events:
+                try:
+                    with self.db.transaction() as conn:
+                        if event[0] == 'search':
+                            self.insert(conn, [event[1:]], [])
+                        else:
+                            self.insert(conn, [], [event[1:]])
+                    self.count(flushed=1)
+                except sqlite3.Error:
+                    self.count(dropped=1)
+            self.count(batches=1)
+
+    def insert(self, conn, searches, views):
+        if searches:
+            conn.executemany(
+                "INSERT INTO search (cid, sessionNo, ts, query) VALUES (?, ?, ?, ?)",
+                searches
+            )
+        if views:
+            conn.executemany(
+                "INSERT INTO viewedProduct (cid, sessionNo, ts, pid) VALUES (?, ?, ?, ?)",
+                views
+            )
+            # Keep the top-viewed leaderboard in step with viewedProduct
+            leaderboards.record_views(conn, [view[3] for view in views])
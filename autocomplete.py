@@ -0,0 +1,181 @@
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+TOKEN = re.compile(r"[a-z0-9][a-z0-9\-+.]*")
+MIN_TOKEN = 2
+
+
+def tokens(text):
+    """Lowercase words of a product name or category"""
+    return [token for token in TOKEN.findall((text or "").lower()) if len(token) >= MIN_TOKEN]
+
+
+class PrefixIndex:
+    """Sorted array of terms with a weight each, answering prefix lookups
+
+    The terms are one sorted list and the weights a parallel array, so a
+    lookup is a bisect to the first term with the prefix and a short scan.
+    """
+
+    def __init__(self, weights):
+        self.terms = sorted(weights)
+        self.weights = array('L', (weights[term] for term in self.terms))
+
+    def lookup(self, prefix, limit=8, max_scan=256):
+        """The heaviest terms starting with prefix, at most max_scan are looked at"""
+        start = bisect_left(self.terms, prefix)
+        found = []
+        for i in range(start, min(start + max_scan, len(self.terms))):
+            if not self.terms[i].startswith(prefix):
+                break
+            found.append((self.weights[i], self.terms[i]))
+        found.sort(key=lambda item: (-item[0], item[1]))
+        return [term for _, term in found[:limit]]
+
+    def memory(self):
+        return (sys.getsizeof(self.terms) + sum(sys.getsizeof(t) for t in self.terms)
+                + sys.getsizeof(self.weights))
+
+
+class Autocomplete:
+    """Suggestions for the search prompt from product words and past searches
+
+    Two prefix indexes are built on the first lookup: words from product
+    names and categories weighted by how many products use them, and the
+    most popular past queries from the search table. Lookups check for
+    changes at most every refresh_interval seconds. New searches and new
+    products (catalog version moved by exactly the number of new rows) are
+    folded into the counts; renames or deletes rebuild the word counts.
+    """
+
+    def __init__(self, db, max_queries=2000, refresh_interval=30.0):
+        self.db = db
+        self.max_queries = max_queries
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+
+        self.word_counts = None
+        self.query_counts = None
+        self.words = None
+        self.queries = None
+        self.catalog_version = None
+        self.last_product = 0
+        self.last_search = 0
+        self.checked = 0.0
+
+        self.lookups = 0
+        self.rebuilds = 0
+        self.refreshes = 0
+
+    def suggest(self, text, limit=8):
+        """Completions for text: popular queries starting with it, then word completions"""
+        text = " ".join(text.lower().split()) + (" " if text.endswith(" ") else "")
+        if not text.strip():
+            return []
+        self.refresh()
+
+        words, queries = self.words, self.queries
+        self.lookups += 1
+        suggestions = queries.lookup(text, limit)
+
+        # Complete the last word, keeping what came before it
+        head, _, last = text.rpartition(" ")
+        if last:
+            prefix = head + " " if head else ""
+            for word in words.lookup(last, limit):
+                suggestion = prefix + word
+                if suggestion not in suggestions:
+                    suggestions.append(suggestion)
+        return suggestions[:limit]
+
+    def refresh(self):
+        """Build the indexes on first use, later fold in what changed"""
+        if self.words is not None and time.monotonic() - self.checked < self.refresh_interval:
+            return
+
+        with self.lock:
+            if self.words is not None and time.monotonic() - self.checked < self.refresh_interval:
+                return
+            with self.db.reader() as conn:
+                conn.execute("BEGIN")
+                version = conn.execute("SELECT version FROM catalog_version").fetchone()[0]
+                if self.word_counts is None:
+                    self.load_words(conn)
+                    self.load_queries(conn)
+                    self.rebuilds += 1
+                else:
+                    self.update_words(conn, version)
+                    self.update_queries(conn)
+                    self.refreshes += 1
+                conn.rollback()
+
+            self.catalog_version = version
+            self.words = PrefixIndex(self.word_counts)
+            self.queries = PrefixIndex(self.query_counts)
+            self.checked = time.monotonic()
+
+    def load_words(self, conn):
+        self.word_counts = {}
+        self.last_product = 0
+        self.add_products(conn)
+
+    def add_products(self, conn):
+        """Count the words of products added since the last load, returns how many"""
+        rows = conn.execute(
+            "SELECT rowid, name, category FROM products WHERE rowid > ?", (self.last_product,)
+        ).fetchall()
+        for row in rows:
+            for word in set(tokens(row['name']) + tokens(row['category'])):
+                self.word_counts[word] = self.word_counts.get(word, 0) + 1
+            self.last_product = max(self.last_product, row['rowid'])
+        return len(rows)
+
+    def update_words(self, conn, version):
+        if version == self.catalog_version:
+            return
+        # Each insert bumps the version once; anything beyond that was an
+        # edit or delete, which can't be folded in word by word
+        added = self.add_products(conn)
+        if version - self.catalog_version != added:
+            self.load_words(conn)
+            self.rebuilds += 1
+
+    def load_queries(self, conn):
+        self.query_counts = {}
+        self.last_search = 0
+        self.update_queries(conn)
+
+    def update_queries(self, conn):
+        rows = conn.execute(
+            """SELECT LOWER(TRIM(query)) AS query, COUNT(*) AS count, MAX(rowid) AS last
+            FROM search WHERE rowid > ? GROUP BY 1""",
+            (self.last_search,)
+        ).fetchall()
+        for row in rows:
+            query = " ".join(row['query'].split())
+            if query:
+                self.query_counts[query] = self.query_counts.get(query, 0) + row['count']
+            self.last_search = max(self.last_search, row['last'])
+
+        # Keep only the most popular queries
+        if len(self.query_counts) > self.max_queries:
+            popular = sorted(self.query_counts.items(), key=lambda item: -item[1])
+            self.query_counts = dict(popular[:self.max_queries])
+
+    def stats(self):
+        words, queries = self.words, self.queries
+        return {
+            'words': len(words.terms) if words else 0,
+            'queries': len(queries.terms) if queries else 0,
+            # The sorted arrays plus the count dicts they are built from
+            'memory_bytes': (words.memory() + queries.memory()
+                             + sys.getsizeof(self.word_counts)
+                             + sys.getsizeof(self.query_counts)) if words else 0,
+            'lookups': self.lookups,
+            'rebuilds': self.rebuilds,
+            'refreshes': self.refreshes,
+        }
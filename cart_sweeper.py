@@ -0,0 +1,89 @@
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+
+class CartSweeper:
+    """Background thread deleting abandoned carts
+
+    A cart is abandoned when its session ended (or, if it never logged
+    out, started) more than max_age_days ago: an active cart is moved to
+    the customer's newest session at every login, so anything older has
+    been left behind. The sweep walks cart in rowid order, batch_size
+    rows per transaction, looking up each row's session by its primary
+    key, so a transaction never does more than one batch of work, however
+    big the sessions table is.
+    """
+
+    def __init__(self, db, max_age_days=30, interval=3600, batch_size=500):
+        self.db = db
+        self.max_age_days = max_age_days
+        self.interval = interval
+        self.batch_size = batch_size
+
+        # Counters
+        self.lock = threading.Lock()
+        self.swept = 0
+        self.runs = 0
+        self.errors = 0
+        self.last_error = None
+
+        self.stopping = threading.Event()
+        self.worker = threading.Thread(target=self.run, name="cart-sweeper", daemon=True)
+        self.worker.start()
+
+    def run(self):
+        # Sweep once at startup, then every interval seconds until close()
+        while True:
+            try:
+                self.sweep()
+            except sqlite3.Error as e:
+                # Batches already committed stay swept, the rest waits for the next run
+                with self.lock:
+                    self.errors += 1
+                    self.last_error = str(e)
+            if self.stopping.wait(self.interval):
+                return
+
+    def sweep(self):
+        """Delete abandoned cart rows, returns how many"""
+        cutoff = (datetime.now() - timedelta(days=self.max_age_days)).isoformat()
+        deleted = 0
+        start = 0
+        while not self.stopping.is_set():
+            with self.db.transaction() as conn:
+                last = conn.execute(
+                    """SELECT MAX(rowid) FROM (
+                        SELECT rowid FROM cart WHERE rowid > ? ORDER BY rowid LIMIT ?
+                    )""",
+                    (start, self.batch_size)
+                ).fetchone()[0]
+                if last is None:
+                    break
+                batch = conn.execute(
+                    """DELETE FROM cart
+                    WHERE rowid > ? AND rowid <= ? AND EXISTS (
+                        SELECT 1 FROM sessions s
+                        WHERE s.cid = cart.cid AND s.sessionNo = cart.sessionNo
+                          AND COALESCE(s.end_time, s.start_time) < ?
+                    )""",
+                    (start, last, cutoff)
+                ).rowcount
+            # Counted per batch, so a run that fails later still shows them
+            with self.lock:
+                self.swept += batch
+            deleted += batch
+            start = last
+
+        with self.lock:
+            self.runs += 1
+        return deleted
+
+    def close(self):
+        self.stopping.set()
+        self.worker.join()
+
+    def stats(self):
+        with self.lock:
+            return {'swept': self.swept, 'runs': self.runs, 'errors': self.errors,
+                    'last_error': self.last_error}
@@ -0,0 +1,305 @@
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass, field
+
+from product_cache import PRODUCT_COLUMNS
+
+# Streaming product import/export in CSV (with a header row) or JSON lines.
+#
+# An import file may have any subset of the product columns as long as pid
+# is one of them. Rows with a name, price and stock_count are upserted (new
+# pids are inserted), other rows, like a price/stock feed, only update
+# existing products. Empty CSV fields count as missing.
+#
+# Rows are applied in file order, batch_size at a time with executemany
+# (a batch ends early where the columns change), one transaction per
+# batch, so memory stays bounded and the write lock is never held for
+# long. Bad rows are collected as errors and skipped.
+
+COLUMNS = [column.strip() for column in PRODUCT_COLUMNS.split(",")]
+FULL_ROW = {'pid', 'name', 'price', 'stock_count'}
+FORMATS = ('csv', 'jsonl')
+MAX_ERRORS_KEPT = 100
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    applied: int = 0
+    not_found: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS_KEPT:
+            self.errors.append(f"line {line}: {message}")
+
+
+@dataclass
+class ExportResult:
+    rows: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+def file_format(path, fmt=None):
+    """The format given, or the one the file extension suggests"""
+    if fmt is None:
+        fmt = 'jsonl' if str(path).lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    return fmt
+
+
+def read_rows(f, fmt):
+    """Yield (line number, record, error) for each record in the file
+
+    error is None, or why the line couldn't be read as a record.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        try:
+            fieldnames = reader.fieldnames or []
+        except csv.Error as e:
+            raise ValueError(f"invalid CSV header ({e})")
+        unknown = set(fieldnames) - set(COLUMNS)
+        if unknown or 'pid' not in fieldnames:
+            raise ValueError(f"CSV header must include pid and only {', '.join(COLUMNS)}")
+        while True:
+            try:
+                record = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield reader.line_num, None, f"invalid CSV ({e})"
+                continue
+            # DictReader puts fields beyond the header under the key None
+            if None in record:
+                yield reader.line_num, None, "too many fields"
+                continue
+            yield reader.line_num, {column: value for column, value in record.items()
+                                    if value not in ('', None) or column == 'pid'}, None
+
+    for line_no, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"invalid JSON ({e})"
+            continue
+        yield line_no, record, None
+
+
+def clean_row(record):
+    """Validated {column: value} for one record, raises ValueError"""
+    if not isinstance(record, dict):
+        raise ValueError("not an object")
+    unknown = set(record) - set(COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown column(s) {', '.join(sorted(unknown))}")
+
+    row = {}
+    pid = str(record.get('pid') or '').strip()
+    if not pid:
+        raise ValueError("pid is required")
+    row['pid'] = pid
+
+    if 'name' in record:
+        name = str(record['name'] or '').strip()
+        if not name:
+            raise ValueError("name can't be empty")
+        row['name'] = name
+    for column in ('category', 'descr'):
+        if column in record:
+            row[column] = str(record[column] if record[column] is not None else '')
+
+    if 'price' in record:
+        try:
+            price = float(record['price'])
+        except (TypeError, ValueError):
+            raise ValueError(f"price {record['price']!r} is not a number")
+        if not price > 0:
+            raise ValueError("price must be positive")
+        row['price'] = price
+
+    if 'stock_count' in record:
+        try:
+            stock = int(str(record['stock_count']).strip())
+        except ValueError:
+            raise ValueError(f"stock_count {record['stock_count']!r} is not a whole number")
+        if stock < 0:
+            raise ValueError("stock_count must be non-negative")
+        row['stock_count'] = stock
+
+    if len(row) == 1:
+        raise ValueError("nothing to change")
+    return row
+
+
+def upsert_sql(columns):
+    """Upsert for full rows, plain UPDATE for partial ones"""
+    changed = [column for column in columns if column != 'pid']
+    if FULL_ROW <= set(columns):
+        # ON CONFLICT DO UPDATE instead of REPLACE: the products row and its
+        # rowid are kept, so the FTS triggers see an update, not a delete
+        return (f"INSERT INTO products ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT (pid) DO UPDATE SET "
+                + ", ".join(f"{column} = excluded.{column}" for column in changed))
+    return (f"UPDATE products SET {', '.join(f'{column} = ?' for column in changed)} "
+            f"WHERE pid = ?")
+
+
+def import_products(db, path, fmt=None, batch_size=5000, products=None, progress=None):
+    """Apply a product file to the database, returns an ImportResult
+
+    products is a ProductCache to invalidate as batches commit, progress
+    is called with the ImportResult after every batch.
+    """
+    fmt = file_format(path, fmt)
+    result = ImportResult()
+    start = time.perf_counter()
+    # Rows waiting to be written. They all have the same columns and a row
+    # with other columns writes them out first, so rows for the same pid
+    # are applied in file order
+    pending = []
+    pending_columns = None
+
+    def write(columns, rows):
+        params = [tuple(row[c] for c in columns) for row in rows]
+        with db.transaction() as conn:
+            matched = conn.executemany(upsert_sql(columns), params).rowcount
+        if FULL_ROW <= set(columns):
+            result.applied += len(rows)
+        else:
+            result.applied += matched
+            result.not_found += len(rows) - matched
+        if products is not None:
+            products.invalidate(*(row['pid'] for row in rows))
+        result.seconds = time.perf_counter() - start
+        if progress:
+            progress(result)
+
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for line_no, record, error in read_rows(f, fmt):
+            result.rows += 1
+            if error:
+                result.add_error(line_no, error)
+                continue
+            try:
+                row = clean_row(record)
+            except ValueError as e:
+                result.add_error(line_no, e)
+                continue
+
+            # pid first for INSERT, last for UPDATE ... WHERE pid = ?
+            if FULL_ROW <= set(row):
+                columns = tuple(c for c in COLUMNS if c in row)
+            else:
+                columns = tuple(c for c in COLUMNS if c in row and c != 'pid') + ('pid',)
+            if columns != pending_columns and pending:
+                write(pending_columns, pending)
+                pending = []
+            pending_columns = columns
+            pending.append(row)
+            if len(pending) >= batch_size:
+                write(columns, pending)
+                pending = []
+
+    if pending:
+        write(pending_columns, pending)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def export_products(db, path, fmt=None, batch_size=5000, progress=None):
+    """Write every product to path, returns an ExportResult
+
+    The rows come from one read transaction, so the file is a consistent
+    snapshot even while sales go on.
+    """
+    fmt = file_format(path, fmt)
+    result = ExportResult()
+    start = time.perf_counter()
+
+    with db.reader() as conn, open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f) if fmt == 'csv' else None
+        if writer:
+            writer.writerow(COLUMNS)
+        conn.execute("BEGIN")
+        cursor = conn.execute(f"SELECT {PRODUCT_COLUMNS} FROM products")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if writer:
+                writer.writerows(tuple(row) for row in rows)
+            else:
+                f.writelines(json.dumps(dict(zip(COLUMNS, row))) + "\n" for row in rows)
+            result.rows += len(rows)
+            result.seconds = time.perf_counter() - start
+            if progress:
+                progress(result)
+        conn.rollback()
+
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def print_progress(result):
+    print(f"\r  {result.rows:,} rows, {result.rows_per_sec:,.0f} rows/sec", end="", flush=True)
+
+
+def main():
+    # Command line: python3 catalog_io.py <db_path> import|export <file>
+    parser = argparse.ArgumentParser(description="Import or export products")
+    parser.add_argument("db_path")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("file")
+    parser.add_argument("--format", choices=FORMATS,
+                        help="default: from the file extension")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    from database import Database
+    db = Database(args.db_path, readers=1)
+    try:
+        if args.action == "import":
+            result = import_products(db, args.file, args.format, args.batch_size,
+                                     progress=print_progress)
+            print(f"\nImported {result.applied:,} of {result.rows:,} rows in "
+                  f"{result.seconds:.1f}s ({result.rows_per_sec:,.0f} rows/sec)")
+            if result.not_found:
+                print(f"{result.not_found:,} rows matched no product")
+            if result.error_count:
+                print(f"{result.error_count:,} rows had errors:")
+                for error in result.errors:
+                    print(f"  {error}")
+        else:
+            result = export_products(db, args.file, args.format, args.batch_size,
+                                     progress=print_progress)
+            print(f"\nExported {result.rows:,} products in {result.seconds:.1f}s "
+                  f"({result.rows_per_sec:,.0f} rows/sec)")
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"\n{args.action.capitalize()} error: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from migrations import migrate
+from query_stats import InstrumentedConnection, QueryStats
+
+
+class Database:
+    """Connection layer shared by every session using one database file
+
+    There is a single writer connection, used by one transaction at a time
+    (write_lock), and a small pool of read-only connections. In WAL mode
+    readers never block the writer and the writer never blocks readers, so
+    many sessions can browse while one of them checks out. Write
+    transactions start with BEGIN IMMEDIATE, and if another process holds
+    the lock for longer than busy_timeout we back off and retry.
+
+    Connections run in autocommit mode (isolation_level=None), so the only
+    transactions are the ones opened explicitly with transaction().
+
+    Every statement on every connection is timed into query_stats; ones
+    slower than slow_query_ms go to its slow log (and slow_query_log file).
+
+    Caches ask external_version() whether another process has committed.
+    """
+
+    def __init__(self, db_name, readers=4, wal=True, busy_timeout=5.0,
+                 write_retries=5, retry_backoff=0.05, slow_query_ms=50.0,
+                 slow_query_log=None, trace=None):
+        self.db_name = db_name
+        # Called with every statement run, values filled in (see
+        # tests/check_query_plans.py)
+        self.trace = trace
+        self.wal = wal
+        self.busy_timeout = busy_timeout
+        self.write_retries = write_retries
+        self.retry_backoff = retry_backoff
+
+        # Statements run by each thread, see statement_count()
+        self.counts = threading.local()
+        self.query_stats = QueryStats(slow_query_ms, log_file=slow_query_log)
+
+        self.writer = self.connect()
+        if wal:
+            self.writer.execute("PRAGMA journal_mode = WAL")
+            # Safe in WAL mode: a power loss can only drop the last commits
+            self.writer.execute("PRAGMA synchronous = NORMAL")
+        self.write_lock = threading.RLock()
+
+        # Bring older database files up to the current schema (indexes etc.).
+        # A failed migration is rolled back and raised: running on a schema
+        # the code doesn't expect would only fail later in stranger ways
+        try:
+            with self.write_lock:
+                migrate(self.writer)
+        except sqlite3.Error:
+            self.writer.close()
+            raise
+
+        # Without WAL readers would block the writer, so share the writer
+        self.readers = queue.Queue()
+        for _ in range(readers if wal else 0):
+            conn = self.connect()
+            conn.execute("PRAGMA query_only = ON")
+            self.readers.put(conn)
+
+        # The writer's PRAGMA data_version moves only when another process
+        # commits; external_changes counts how often it was seen to move
+        self.external_changes = 0
+        with self.write_lock:
+            self.writer_version = self.writer_data_version()
+
+    def connect(self):
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            # Prepared statements are reused by SQL text; the pagers and the
+            # product cache make many variants, keep them all prepared
+            cached_statements=256,
+            factory=InstrumentedConnection
+        )
+        conn.query_stats = self.query_stats
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.row_factory = sqlite3.Row  # Access columns by name
+        conn.set_trace_callback(self.count_statement)
+        return conn
+
+    def count_statement(self, sql):
+        # Statements run inside triggers are reported as "-- TRIGGER ..."
+        if not sql.startswith("--"):
+            self.counts.n = getattr(self.counts, "n", 0) + 1
+            if self.trace is not None:
+                self.trace(sql)
+
+    def statement_count(self):
+        """SQL statements run so far by the calling thread
+
+        Take the difference before and after a request to see how many
+        statements it ran (a request is handled by one thread).
+        """
+        return getattr(self.counts, "n", 0)
+
+    @contextmanager
+    def transaction(self):
+        """Run a write transaction on the writer connection
+
+        Commits when the block finishes, rolls back if it raises. The block
+        may also call conn.rollback() itself to abandon the changes.
+        """
+        with self.write_lock:
+            self.begin_immediate()
+            # Nobody else can commit until we do, so this sees every commit
+            # another process made before this transaction
+            self.check_data_version()
+            try:
+                yield self.writer
+            except BaseException:
+                if self.writer.in_transaction:
+                    self.writer.rollback()
+                raise
+            else:
+                if self.writer.in_transaction:
+                    self.writer.commit()
+
+    def begin_immediate(self):
+        """BEGIN IMMEDIATE, retrying with backoff while another process holds the lock"""
+        for attempt in range(self.write_retries + 1):
+            try:
+                self.writer.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                busy = "locked" in str(e) or "busy" in str(e)
+                if not busy or attempt == self.write_retries:
+                    raise
+                # Exponential backoff with jitter so waiting writers spread out
+                delay = self.retry_backoff * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay))
+
+    def writer_data_version(self):
+        return self.writer.execute("PRAGMA data_version").fetchone()[0]
+
+    def check_data_version(self):
+        # Call holding write_lock
+        version = self.writer_data_version()
+        if version != self.writer_version:
+            self.writer_version = version
+            self.external_changes += 1
+
+    def external_version(self):
+        """A counter that moves when another process has committed
+
+        This process's own commits are left out, so caches only need to
+        drop everything for changes they weren't told about. It never
+        waits for an open write transaction: then the counter is returned
+        as it is, since that transaction checked when it began and no
+        other process can commit until it ends.
+        """
+        if self.write_lock.acquire(blocking=False):
+            try:
+                self.check_data_version()
+            finally:
+                self.write_lock.release()
+        return self.external_changes
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read-only connection from the pool"""
+        if not self.wal:
+            with self.write_lock:
+                yield self.writer
+            return
+
+        conn = self.readers.get()
+        try:
+            yield conn
+        finally:
+            # Never hand back a connection with a read transaction still open
+            if conn.in_transaction:
+                conn.rollback()
+            self.readers.put(conn)
+
+    def query(self, sql, params=()):
+        """Run a SELECT on a pooled reader, returns all rows"""
+        with self.reader() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        """Run a SELECT on a pooled reader, returns the first row or None"""
+        with self.reader() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def close(self):
+        while not self.readers.empty():
+            self.readers.get().close()
+        with self.write_lock:
+            try:
+                # Refresh planner statistics if the data changed a lot this run
+                self.writer.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            self.writer.close()
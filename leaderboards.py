@@ -0,0 +1,106 @@
+import sqlite3
+import sys
+from collections import Counter
+
+# Per-product counters for the top_products leaderboards.
+#   order_count  number of distinct orders containing the product
+#   view_count   number of rows in viewedProduct for the product
+# They are bumped at checkout and when views are logged, and can be
+# recomputed from orderlines/viewedProduct with rebuild().
+
+CREATE_TABLES = [
+    # pid is left untyped so it compares (and uses the products index)
+    # whether products.pid is declared int or text
+    """CREATE TABLE IF NOT EXISTS product_stats (
+        pid         primary key,
+        order_count int not null default 0,
+        view_count  int not null default 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_product_stats_orders ON product_stats (order_count)",
+    "CREATE INDEX IF NOT EXISTS idx_product_stats_views ON product_stats (view_count)",
+]
+
+# RANK() <= 3 means fewer than three products have a higher count, i.e. the
+# count is at least that of the 3rd product. Both lookups walk the index
+# from the top, so the cost doesn't depend on how much history there is.
+# CROSS JOIN keeps product_stats as the outer loop so its index is used.
+LEADERBOARD_QUERY = """
+    SELECT p.pid, p.name, p.category, s.{column}
+    FROM product_stats s
+    CROSS JOIN products p ON p.pid = s.pid
+    WHERE s.{column} > 0
+      AND s.{column} >= COALESCE((
+          SELECT {column} FROM product_stats
+          WHERE {column} > 0
+          ORDER BY {column} DESC
+          LIMIT 1 OFFSET ?
+      ), 1)
+    ORDER BY s.{column} DESC, p.name
+"""
+
+
+def create_tables(conn):
+    for statement in CREATE_TABLES:
+        conn.execute(statement)
+
+
+def record_order(conn, ono):
+    """Count a new order for each of its products, call inside the order's transaction"""
+    conn.execute(
+        """INSERT INTO product_stats (pid, order_count, view_count)
+        SELECT DISTINCT pid, 1, 0 FROM orderlines WHERE ono = ?
+        ON CONFLICT (pid) DO UPDATE SET order_count = order_count + 1""",
+        (ono,)
+    )
+
+
+def record_views(conn, pids):
+    """Count a batch of product views, one upsert per distinct product"""
+    conn.executemany(
+        """INSERT INTO product_stats (pid, order_count, view_count) VALUES (?, 0, ?)
+        ON CONFLICT (pid) DO UPDATE SET view_count = view_count + excluded.view_count""",
+        Counter(pids).items()
+    )
+
+
+def rebuild(conn):
+    """Recompute every counter from orderlines and viewedProduct"""
+    conn.execute("DELETE FROM product_stats")
+    conn.execute(
+        """INSERT INTO product_stats (pid, order_count, view_count)
+        SELECT pid, COUNT(DISTINCT ono), 0 FROM orderlines GROUP BY pid"""
+    )
+    conn.execute(
+        """INSERT INTO product_stats (pid, order_count, view_count)
+        SELECT pid, 0, COUNT(*) FROM viewedProduct WHERE true GROUP BY pid
+        ON CONFLICT (pid) DO UPDATE SET view_count = excluded.view_count"""
+    )
+
+
+def top_by_orders(conn, limit=3):
+    """Products ranked in the top `limit` by distinct orders, ties included"""
+    return conn.execute(
+        LEADERBOARD_QUERY.format(column="order_count"), (limit - 1,)
+    ).fetchall()
+
+
+def top_by_views(conn, limit=3):
+    """Products ranked in the top `limit` by views, ties included"""
+    return conn.execute(
+        LEADERBOARD_QUERY.format(column="view_count"), (limit - 1,)
+    ).fetchall()
+
+
+if __name__ == "__main__":
+    # Rebuild command: python3 leaderboards.py <db_path>
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} <db_path>")
+        sys.exit(1)
+
+    conn = sqlite3.connect(sys.argv[1])
+    create_tables(conn)
+    rebuild(conn)
+    conn.commit()
+    products = conn.execute("SELECT COUNT(*) FROM product_stats").fetchone()[0]
+    conn.close()
+    print(f"Leaderboards rebuilt ({products} products).")
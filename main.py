@@ -1,20 +1,49 @@
 import sqlite3
 import sys
 import getpass
-from datetime import datetime, timedelta
+from datetime import datetime
+from database import Database
+from query_stats import format_report
+from catalog_io import print_progress
+from service import ShopService, ServiceError, OutOfStock, SearchFilters
+
+try:
+    import readline  # Tab completion at the search prompt
+except ImportError:
+    readline = None
 
 class ECommerceSystem:
-    def __init__(self, db_name):
-        self.conn = sqlite3.connect(db_name)
-        self.conn.execute("PRAGMA foreign_keys = ON")
-        self.conn.row_factory = sqlite3.Row  # Access columns by name
-        self.cursor = self.conn.cursor()
-        self.current_uid = None
-        self.current_role = None
-        self.session_no = None
+    """Terminal front end, every workflow is done by a ShopService"""
+    
+    def __init__(self, db_name, db=None, activity=None, products=None, service=None):
+        # Sessions in the same process can share one Database (writer + reader pool)
+        # and one ShopService with its ActivityLogger and ProductCache
+        self.owns_db = db is None and service is None
+        self.db = service.db if service else (db or Database(db_name))
+        self.owns_service = service is None
+        self.service = service or ShopService(self.db, activity, products)
+        self.session = None
+        # Last search, for the filter/sort prompt
+        self.search_query = ""
+        self.search_filters = None
+    
+    @property
+    def current_uid(self):
+        return self.session.uid if self.session else None
+    
+    @property
+    def current_role(self):
+        return self.session.role if self.session else None
+    
+    @property
+    def session_no(self):
+        return self.session.session_no if self.session else None
     
     def close(self):
-        self.conn.close()
+        if self.owns_service:
+            self.service.close()
+        if self.owns_db:
+            self.db.close()
     
     def login(self):
         print("\n=== LOGIN ===")
@@ -22,17 +51,10 @@ class ECommerceSystem:
         pwd = getpass.getpass("Password: ")
         
         try:
-            # Parameterized query prevents SQL injection
-            self.cursor.execute(
-                "SELECT uid, role FROM users WHERE uid = ? AND pwd = ?",
-                (uid, pwd)
-            )
-            user = self.cursor.fetchone()
+            session = self.service.login(uid, pwd)
             
-            if user:
-                self.current_uid = user['uid']
-                self.current_role = user['role']
-                self.start_session()
+            if session:
+                self.session = session
                 print(f"\nWelcome! Logged in as {self.current_role}.")
                 return True
             else:
@@ -41,7 +63,7 @@ class ECommerceSystem:
         except sqlite3.Error as e:
             print(f"Login error: {e}")
             return False
-        
+    
     def register(self):
         print("\n=== REGISTRATION ===")
         name = input("Name: ").strip()
@@ -54,100 +76,28 @@ class ECommerceSystem:
             return False
         
         try:
-            # Check if email exists
-            self.cursor.execute(
-                "SELECT email FROM customers WHERE email = ?", (email,)
-            )
-            if self.cursor.fetchone():
-                print("Email already registered.")
-                return False
-            
-            # Generate unique uid
-            self.cursor.execute("SELECT MAX(CAST(uid AS INTEGER)) FROM users")
-            max_uid = self.cursor.fetchone()[0]
-            new_uid = str((max_uid or 0) + 1)
-            
-            # Generate unique cid
-            self.cursor.execute("SELECT MAX(CAST(cid AS INTEGER)) FROM customers")
-            max_cid = self.cursor.fetchone()[0]
-            new_cid = str((max_cid or 0) + 1)
-            
-            # Insert into users
-            self.cursor.execute(
-                "INSERT INTO users (uid, pwd, role) VALUES (?, ?, 'customer')",
-                (new_uid, pwd)
-            )
-            
-            # Insert into customers
-            self.cursor.execute(
-                "INSERT INTO customers (cid, name, email) VALUES (?, ?, ?)",
-                (new_cid, name, email)
-            )
-            
-            self.conn.commit()
+            new_uid = self.service.register(name, email, pwd)
             print(f"\nRegistration successful! Your User ID is: {new_uid}")
             return True
+        except ServiceError as e:
+            print(e)
+            return False
         except sqlite3.Error as e:
             print(f"Registration error: {e}")
-            self.conn.rollback()
             return False
-
-    def start_session(self):
-        """Start a new session for the current user"""
-        try:
-            cid = self.get_customer_id()
-            
-            # Get next session number
-            # sessionNo is a weak key dependent on cid
-            # so we add the next cid of that user
-            self.cursor.execute(
-                "SELECT MAX(sessionNo) FROM sessions WHERE cid = ?", (cid,)
-            )
-            max_session = self.cursor.fetchone()[0]
-            self.session_no = (max_session or 0) + 1
-            
-            # Insert new session
-            self.cursor.execute(
-                "INSERT INTO sessions (cid, sessionNo, start_time) VALUES (?, ?, ?)",
-                (cid, self.session_no, datetime.now().isoformat())
-            )
-            self.conn.commit()
-        except sqlite3.Error as e:
-            print(f"Session error: {e}")
-            self.session_no = 1
-
-    def get_customer_id(self):
-        """Get customer ID for current user"""
-        try:
-            # Find matching customer by uid
-            self.cursor.execute(
-                "SELECT cid FROM customers WHERE uid = ?", (self.current_uid,)
-            )
-            result = self.cursor.fetchone()
-            if result:
-                return result['cid']
-            return self.current_uid
-        except sqlite3.Error:
-            return self.current_uid
-
+    
     def logout(self):
         """End session and logout"""
         try:
-            if self.session_no:
-                cid = self.get_customer_id()
-                self.cursor.execute(
-                    "UPDATE sessions SET end_time = ? WHERE cid = ? AND sessionNo = ?",
-                    (datetime.now().isoformat(), cid, self.session_no)
-                )
-                self.conn.commit()
+            if self.session:
+                # Also writes out this session's buffered searches and views
+                self.service.logout(self.session)
         except sqlite3.Error as e:
             print(f"Logout error: {e}")
         
-        self.current_uid = None
-        self.current_role = None
-        self.session_no = None
+        self.session = None
         print("\nLogged out successfully.")
-
+    
     def customer_menu(self):
         while True:
             print("\n=== CUSTOMER MENU ===")
@@ -172,14 +122,18 @@ class ECommerceSystem:
                 break
             else:
                 print("Invalid choice.")
-
+    
     def sales_menu(self):
         while True:
             print("\n=== SALES MENU ===")
             print("1. Check/update product")
             print("2. Sales report")
             print("3. Top-selling products")
-            print("4. Logout")
+            print("4. Sales report for a date range")
+            print("5. Import products from file")
+            print("6. Export products to file")
+            print("7. Query statistics")
+            print("8. Logout")
             
             choice = input("\nChoice: ").strip()
             
@@ -190,214 +144,220 @@ class ECommerceSystem:
             elif choice == '3':
                 self.top_products()
             elif choice == '4':
+                self.range_sales_report()
+            elif choice == '5':
+                self.import_products()
+            elif choice == '6':
+                self.export_products()
+            elif choice == '7':
+                self.query_statistics()
+            elif choice == '8':
                 self.logout()
                 break
             else:
                 print("Invalid choice.")
-
+    
     # Used to paginate various things, like search results and orders
-    def paginate_results(self, items, display_func, action_func, page_size=5):
-        """Generic pagination handler"""
-        if not items:
+    def paginate_results(self, first_page, fetch_page, display_func, action_func):
+        """Generic pagination handler, fetch_page(page_no) returns a service Page"""
+        page = first_page
+        if not page.items:
             print("\nNo results found.")
             return
         
-        total_pages = (len(items) + page_size - 1) // page_size
-        current_page = 0
-        
         while True:
-            # Get current page items
-            start = current_page * page_size
-            end = min(start + page_size, len(items))
-            page_items = items[start:end]
-            
             # Display items using provided function
-            display_func(page_items)
+            display_func(page.items)
             
             # Show navigation
-            print(f"\nPage {current_page + 1} of {total_pages}")
+            print(f"\nPage {page.page + 1} of {page.total_pages}")
             options = []
-            if current_page > 0:
+            if page.page > 0:
                 options.append("'p' for previous")
-            if current_page < total_pages - 1:
+            if page.has_next:
                 options.append("'n' for next")
             options.append("'s' to select")
             options.append("'b' to go back")
-
+            
             if display_func == self.display_product_summary:
                 options.append("'e' to edit query")
+                options.append("'f' to filter/sort")
             
             print(" | ".join(options))
             
             choice = input("\nChoice: ").strip().lower()
             
-            if choice == 'n' and current_page < total_pages - 1:
-                current_page += 1
-            elif choice == 'p' and current_page > 0:
-                current_page -= 1
+            if choice == 'n' and page.has_next:
+                page = fetch_page(page.page + 1)
+            elif choice == 'p' and page.page > 0:
+                page = fetch_page(page.page - 1)
             elif choice == 's':
-                action_func(items)
+                action_func(page.items)
             elif choice == 'e' and display_func == self.display_product_summary:
                 # Jump to search implementation results on one additional stack entry
                 self.search_products()
                 break
+            elif choice == 'f' and display_func == self.display_product_summary:
+                filters = self.ask_search_filters()
+                if filters is not None:
+                    self.search_products(self.search_query, filters)
+                    break
             elif choice == 'b':
                 break
             else:
                 print("Invalid choice.")
-
-    def search_products(self):
-        keywords_input = input("\nEnter search keyword(s): ").strip()
-        
-        if not keywords_input:
-            print("Please enter a search term.")
-            return
-        
-        # Record search with original query
-        try:
-            cid = self.get_customer_id()
-            self.cursor.execute(
-                "INSERT INTO search (cid, sessionNo, ts, query) VALUES (?, ?, ?, ?)",
-                (cid, self.session_no, datetime.now().isoformat(), keywords_input)
-            )
-            self.conn.commit()
-        except sqlite3.Error as e:
-            print(f"Search recording error: {e}")
-
-        # Split into individual keywords
-        keywords = keywords_input.split()
-        
-        # Build dynamic query with AND semantics for multiple keywords
-        # Each keyword must appear in at least one field (name, descr, or category)
-        conditions = []
-        params = []
-        
-        for keyword in keywords:
-            keyword_lower = f"%{keyword.lower()}%"
-            conditions.append(
-                "(LOWER(name) LIKE ? OR LOWER(descr) LIKE ? OR LOWER(category) LIKE ?)"
-            )
-            params.extend([keyword_lower, keyword_lower, keyword_lower])
-        
-        # Combine conditions with AND
-        where_clause = " AND ".join(conditions)
-        
-        query = f"""
-            SELECT pid, name, category, price, stock_count, descr 
-            FROM products 
-            WHERE {where_clause}
-            ORDER BY name
-        """
+    
+    def search_products(self, keywords_input=None, filters=None):
+        if keywords_input is None:
+            keywords_input = self.input_with_suggestions("\nEnter search keyword(s): ").strip()
+        self.search_query = keywords_input
+        self.search_filters = filters
         
         try:
-            self.cursor.execute(query, params)
-            results = self.cursor.fetchall()
+            # Each keyword must appear in at least one field (name, descr, or category)
+            page = self.service.search(self.session, keywords_input, filters=filters)
             
-            if not results:
+            if not page.items:
                 print("No products found.")
                 return
+            if page.corrected:
+                print(f"\nNo products match '{keywords_input}', showing results for '{page.corrected}'.")
             
-            self.paginate_results(results, self.display_product_summary, 
-                                self.handle_product_selection)
+            self.paginate_results(
+                page,
+                lambda page_no: self.service.search(self.session, keywords_input, page_no,
+                                                    filters=filters),
+                self.display_product_summary,
+                self.handle_product_selection
+            )
+        except ServiceError as e:
+            print(e)
         except sqlite3.Error as e:
             print(f"Search error: {e}")
-
+    
+    def input_with_suggestions(self, prompt):
+        """input() where Tab completes the search from the service's suggestions"""
+        if readline is None:
+            return input(prompt)
+        
+        suggestions = []
+        def complete(text, state):
+            if state == 0:
+                suggestions[:] = self.service.suggest(self.session, readline.get_line_buffer())
+            return suggestions[state] if state < len(suggestions) else None
+        
+        # Complete the whole line, not just the word under the cursor
+        old_completer, old_delims = readline.get_completer(), readline.get_completer_delims()
+        readline.set_completer(complete)
+        readline.set_completer_delims("")
+        readline.parse_and_bind("tab: complete")
+        try:
+            return input(prompt)
+        finally:
+            readline.set_completer(old_completer)
+            readline.set_completer_delims(old_delims)
+    
+    def ask_search_filters(self):
+        """Prompt for a category, price range, stock and sort order, None if invalid"""
+        print("\n=== FILTER / SORT ===")
+        # Matches per category for the last search, counted only when asked for
+        facets = self.service.search_facets(self.session, self.search_query, self.search_filters)
+        for i, facet in enumerate(facets, 1):
+            print(f"{i}. {facet.category} ({facet.count})")
+        
+        try:
+            choice = input("Category number (Enter for all): ").strip()
+            category = facets[int(choice) - 1].category if choice else None
+            min_price = input("Minimum price (Enter for none): ").strip()
+            max_price = input("Maximum price (Enter for none): ").strip()
+            in_stock = input("In stock only? (y/n): ").strip().lower() == 'y'
+            print("Sort by: 1. Name  2. Price low to high  3. Price high to low")
+            sort = input("Sort (Enter for name): ").strip() or '1'
+            
+            return SearchFilters(
+                category=category,
+                min_price=float(min_price) if min_price else None,
+                max_price=float(max_price) if max_price else None,
+                in_stock=in_stock,
+                sort={'1': 'name', '2': 'price_asc', '3': 'price_desc'}[sort]
+            )
+        except (ValueError, IndexError, KeyError):
+            print("Invalid filter.")
+            return None
+    
     def display_product_summary(self, products):
         """Display function for pagination"""
         for p in products:
             print(f"\n{'='*50}")
-            print(f"ID: {p['pid']} | {p['name']}")
-            print(f"Category: {p['category']} | Price: ${p['price']:.2f}")
-            print(f"Stock: {p['stock_count']} units")
-
+            print(f"ID: {p.pid} | {p.name}")
+            print(f"Category: {p.category} | Price: ${p.price:.2f}")
+            print(f"Stock: {p.stock_count} units")
+    
     def handle_product_selection(self, products):
         """Action function for pagination"""
         pid = input("\nEnter product ID to view details (or 'b' to go back): ").strip()
         if pid.lower() == 'b':
             return
         
-        product = next((p for p in products if str(p['pid']) == pid), None)
+        product = next((p for p in products if str(p.pid) == pid), None)
         if product:
             self.view_product_detail(product)
         else:
             print("Invalid product ID.")
-
+    
     def view_product_detail(self, product):
+        try:
+            # The search page may be a while old, show the current price and stock
+            product = self.service.view_product(self.session, product.pid) or product
+        except sqlite3.Error as e:
+            print(f"Product error: {e}")
+            return
+        
         print(f"\n{'='*60}")
         print(f"PRODUCT DETAILS")
         print(f"{'='*60}")
-        print(f"ID: {product['pid']}")
-        print(f"Name: {product['name']}")
-        print(f"Category: {product['category']}")
-        print(f"Price: ${product['price']:.2f}")
-        print(f"Stock: {product['stock_count']} units available")
-        print(f"Description: {product['descr']}")
+        print(f"ID: {product.pid}")
+        print(f"Name: {product.name}")
+        print(f"Category: {product.category}")
+        print(f"Price: ${product.price:.2f}")
+        print(f"Stock: {product.stock_count} units available")
+        print(f"Description: {product.descr}")
         print(f"{'='*60}")
         
-        # Record view
         try:
-            cid = self.get_customer_id()
-            self.cursor.execute(
-                "INSERT INTO viewedProduct (cid, sessionNo, ts, pid) VALUES (?, ?, ?, ?)",
-                (cid, self.session_no, datetime.now().isoformat(), product['pid'])
-            )
-            self.conn.commit()
-        except sqlite3.Error as e:
-            print(f"View recording error: {e}")
+            also_bought = self.service.also_bought(self.session, product.pid)
+        except sqlite3.Error:
+            also_bought = []
+        if also_bought:
+            print("\nCustomers who bought this also bought:")
+            for item in also_bought:
+                print(f"  {item.name} (ID: {item.pid}) - ${item.price:.2f}")
         
         # Add to cart option
-        if product['stock_count'] > 0:
+        if product.stock_count > 0:
             add = input("\nAdd to cart? (y/n): ").strip().lower()
             if add == 'y':
-                self.add_to_cart(product['pid'])
+                self.add_to_cart(product.pid)
         else:
             print("\nThis product is out of stock.")
-
+    
     def add_to_cart(self, pid, qty=1):
         try:
-            cid = self.get_customer_id()
-            
-            # Check if already in cart
-            self.cursor.execute(
-                "SELECT qty FROM cart WHERE cid = ? AND sessionNo = ? AND pid = ?",
-                (cid, self.session_no, pid)
-            )
-            existing = self.cursor.fetchone()
-            
-            if existing:
-                new_qty = existing['qty'] + qty
-                self.cursor.execute(
-                    "UPDATE cart SET qty = ? WHERE cid = ? AND sessionNo = ? AND pid = ?",
-                    (new_qty, cid, self.session_no, pid)
-                )
+            new_qty = self.service.add_to_cart(self.session, pid, qty)
+            if new_qty > qty:
                 print(f"Updated quantity in cart! (Now: {new_qty})")
             else:
-                self.cursor.execute(
-                    "INSERT INTO cart (cid, sessionNo, pid, qty) VALUES (?, ?, ?, ?)",
-                    (cid, self.session_no, pid, qty)
-                )
                 print("Added to cart!")
-            
-            self.conn.commit()
+        except ServiceError as e:
+            print(e)
         except sqlite3.Error as e:
             print(f"Cart error: {e}")
-            self.conn.rollback()
-
+    
     def view_cart(self):
         try:
-            cid = self.get_customer_id()
-            self.cursor.execute(
-                """SELECT c.pid, p.name, p.price, c.qty, p.stock_count,
-                        (p.price * c.qty) as total
-                FROM cart c
-                JOIN products p ON c.pid = p.pid
-                WHERE c.cid = ? AND c.sessionNo = ?
-                ORDER BY p.name""",
-                (cid, self.session_no)
-            )
-            items = self.cursor.fetchall()
+            cart = self.service.cart(self.session)
             
-            if not items:
+            if not cart.items:
                 print("\nYour cart is empty.")
                 return
             
@@ -405,16 +365,14 @@ class ECommerceSystem:
             print("SHOPPING CART")
             print("="*60)
             
-            grand_total = 0
-            for item in items:
-                print(f"\nProduct ID: {item['pid']}")
-                print(f"Name: {item['name']}")
-                print(f"Price: ${item['price']:.2f} x {item['qty']} = ${item['total']:.2f}")
-                print(f"Available stock: {item['stock_count']}")
-                grand_total += item['total']
+            for item in cart.items:
+                print(f"\nProduct ID: {item.pid}")
+                print(f"Name: {item.name}")
+                print(f"Price: ${item.price:.2f} x {item.qty} = ${item.total:.2f}")
+                print(f"Available stock: {item.stock_count}")
             
             print(f"\n{'='*60}")
-            print(f"GRAND TOTAL: ${grand_total:.2f}")
+            print(f"GRAND TOTAL: ${cart.total:.2f}")
             print(f"{'='*60}")
             
             # Cart management options
@@ -433,113 +391,52 @@ class ECommerceSystem:
                 print("Invalid choice.")
         except sqlite3.Error as e:
             print(f"Cart error: {e}")
-
+    
     def update_cart_qty(self):
         pid = input("\nEnter product ID: ").strip()
         qty_str = input("Enter new quantity: ").strip()
         
         try:
             qty = int(qty_str)
-            if qty <= 0:
-                print("Quantity must be positive.")
-                return
-            
-            # Check stock
-            self.cursor.execute(
-                "SELECT stock_count, name FROM products WHERE pid = ?", (pid,)
-            )
-            product = self.cursor.fetchone()
-            
-            if not product:
-                print("Product not found.")
-                return
-            
-            if qty > product['stock_count']:
-                print(f"Insufficient stock for {product['name']}.")
-                print(f"Available: {product['stock_count']} units")
-                return
-            
-            # Update cart
-            cid = self.get_customer_id()
-            self.cursor.execute(
-                "UPDATE cart SET qty = ? WHERE cid = ? AND sessionNo = ? AND pid = ?",
-                (qty, cid, self.session_no, pid)
-            )
-            
-            if self.cursor.rowcount > 0:
-                self.conn.commit()
-                print(f"Quantity updated to {qty}!")
-            else:
-                print("Product not in cart.")
-                
+            self.service.update_cart_qty(self.session, pid, qty)
+            print(f"Quantity updated to {qty}!")
         except ValueError:
             print("Invalid quantity. Please enter a number.")
+        except ServiceError as e:
+            print(e)
         except sqlite3.Error as e:
             print(f"Update error: {e}")
-            self.conn.rollback()
-
+    
     def remove_from_cart(self):
         pid = input("\nEnter product ID to remove: ").strip()
         
         try:
-            cid = self.get_customer_id()
-            
-            # Check if item exists in cart first
-            self.cursor.execute(
-                """SELECT p.name FROM cart c
-                JOIN products p ON c.pid = p.pid
-                WHERE c.cid = ? AND c.sessionNo = ? AND c.pid = ?""",
-                (cid, self.session_no, pid)
-            )
-            item = self.cursor.fetchone()
-            
-            if not item:
-                print("Product not in cart.")
-                return
-            
-            # Remove item
-            self.cursor.execute(
-                "DELETE FROM cart WHERE cid = ? AND sessionNo = ? AND pid = ?",
-                (cid, self.session_no, pid)
-            )
-            self.conn.commit()
-            print(f"{item['name']} removed from cart!")
-            
+            name = self.service.remove_from_cart(self.session, pid)
+            print(f"{name} removed from cart!")
+        except ServiceError as e:
+            print(e)
         except sqlite3.Error as e:
             print(f"Remove error: {e}")
-            self.conn.rollback()
-
-
+    
+    def print_stock_issues(self, issues):
+        print("\nCannot proceed with checkout. Stock issues:")
+        for issue in issues:
+            print(f"  - {issue.name}: Need {issue.qty}, only {issue.stock_count} available")
+        print("\nPlease update your cart quantities.")
+    
     def checkout(self):
         try:
-            cid = self.get_customer_id()
-            
             # Get cart items
-            self.cursor.execute(
-                """SELECT c.pid, p.name, p.price, c.qty, p.stock_count
-                FROM cart c
-                JOIN products p ON c.pid = p.pid
-                WHERE c.cid = ? AND c.sessionNo = ?
-                ORDER BY p.name""",
-                (cid, self.session_no)
-            )
-            items = self.cursor.fetchall()
+            cart = self.service.cart(self.session)
             
-            if not items:
+            if not cart.items:
                 print("\nYour cart is empty. Add items before checkout.")
                 return
             
             # Validate stock for all items
-            stock_issues = []
-            for item in items:
-                if item['qty'] > item['stock_count']:
-                    stock_issues.append(f"  - {item['name']}: Need {item['qty']}, only {item['stock_count']} available")
-            
+            stock_issues = cart.stock_issues()
             if stock_issues:
-                print("\nCannot proceed with checkout. Stock issues:")
-                for issue in stock_issues:
-                    print(issue)
-                print("\nPlease update your cart quantities.")
+                self.print_stock_issues(stock_issues)
                 return
             
             # Display order summary
@@ -547,15 +444,12 @@ class ECommerceSystem:
             print("ORDER SUMMARY")
             print("="*60)
             
-            grand_total = 0
-            for item in items:
-                subtotal = item['price'] * item['qty']
-                print(f"\n{item['name']}")
-                print(f"  Quantity: {item['qty']} x ${item['price']:.2f} = ${subtotal:.2f}")
-                grand_total += subtotal
+            for item in cart.items:
+                print(f"\n{item.name}")
+                print(f"  Quantity: {item.qty} x ${item.price:.2f} = ${item.total:.2f}")
             
             print(f"\n{'='*60}")
-            print(f"TOTAL: ${grand_total:.2f}")
+            print(f"TOTAL: ${cart.total:.2f}")
             print(f"{'='*60}")
             
             # Get shipping address
@@ -567,93 +461,50 @@ class ECommerceSystem:
                 return
             
             # Confirm order
-            print(f"\nTotal amount: ${grand_total:.2f}")
+            print(f"\nTotal amount: ${cart.total:.2f}")
             confirm = input("Confirm order? (yes/no): ").strip().lower()
             
             if confirm not in ['yes', 'y']:
                 print("Order cancelled.")
                 return
             
-            # Generate unique order number
-            self.cursor.execute("SELECT MAX(CAST(ono AS INTEGER)) FROM orders")
-            max_ono = self.cursor.fetchone()[0]
-            ono = str((max_ono or 0) + 1)
-            
-            # Create order
-            self.cursor.execute(
-                """INSERT INTO orders (ono, cid, sessionNo, odate, shipping_address)
-                VALUES (?, ?, ?, ?, ?)""",
-                (ono, cid, self.session_no, datetime.now().date().isoformat(), address)
-            )
-            
-            # Create order lines and update stock
-            line_no = 1
-            for item in items:
-                # Insert order line
-                self.cursor.execute(
-                    """INSERT INTO orderlines (ono, lineNo, pid, qty, uprice)
-                    VALUES (?, ?, ?, ?, ?)""",
-                    (ono, line_no, item['pid'], item['qty'], item['price'])
-                )
-                
-                # Update stock
-                self.cursor.execute(
-                    "UPDATE products SET stock_count = stock_count - ? WHERE pid = ?",
-                    (item['qty'], item['pid'])
-                )
-                
-                line_no += 1
-            
-            # Clear cart
-            self.cursor.execute(
-                "DELETE FROM cart WHERE cid = ? AND sessionNo = ?",
-                (cid, self.session_no)
-            )
-            
-            self.conn.commit()
+            receipt = self.service.checkout(self.session, address)
             
             print("\n" + "="*60)
             print("ORDER PLACED SUCCESSFULLY!")
             print("="*60)
-            print(f"Order Number: {ono}")
-            print(f"Total: ${grand_total:.2f}")
-            print(f"Shipping to: {address}")
+            print(f"Order Number: {receipt.ono}")
+            print(f"Total: ${receipt.total:.2f}")
+            print(f"Shipping to: {receipt.address}")
             print("\nThank you for your order!")
-            
+        
+        except OutOfStock as e:
+            # Stock changed since the summary, e.g. another customer bought it
+            self.print_stock_issues(e.issues)
+        except ServiceError as e:
+            print(f"\n{e}")
         except sqlite3.Error as e:
             print(f"\nCheckout error: {e}")
-            self.conn.rollback()
-
+    
     def view_orders(self):
         try:
-            cid = self.get_customer_id()
-            
-            # Get all orders for this customer
-            self.cursor.execute(
-                """SELECT o.ono, o.odate, o.shipping_address,
-                        SUM(ol.qty * ol.uprice) as total
-                FROM orders o
-                JOIN orderlines ol ON o.ono = ol.ono
-                WHERE o.cid = ?
-                GROUP BY o.ono
-                ORDER BY o.odate DESC""",
-                (cid,)
-            )
-            orders = self.cursor.fetchall()
+            # Orders for this customer, newest first, fetched a page at a time
+            page = self.service.list_orders(self.session)
             
-            if not orders:
+            if not page.items:
                 print("\nYou have no orders yet.")
                 return
             
             # Use pagination to display orders
             self.paginate_results(
-                orders,
+                page,
+                lambda page_no: self.service.list_orders(self.session, page_no),
                 self.display_order_summary,
                 self.handle_order_selection
             )
         except sqlite3.Error as e:
             print(f"Orders error: {e}")
-
+    
     def display_order_summary(self, orders):
         """Display function for order pagination"""
         print("\n" + "="*60)
@@ -661,76 +512,57 @@ class ECommerceSystem:
         print("="*60)
         
         for o in orders:
-            print(f"\nOrder #{o['ono']}")
-            print(f"Date: {o['odate']}")
-            print(f"Total: ${o['total']:.2f}")
-            print(f"Shipping: {o['shipping_address']}")
+            print(f"\nOrder #{o.ono}")
+            print(f"Date: {o.odate}")
+            print(f"Total: ${o.total:.2f}")
+            print(f"Shipping: {o.shipping_address}")
             print("-" * 60)
-
+    
     def handle_order_selection(self, orders):
         """Action function for order pagination"""
         ono = input("\nEnter order number for details (or 'b' to go back): ").strip()
         if ono.lower() == 'b':
             return
         
-        order = next((o for o in orders if str(o['ono']) == ono), None)
+        order = next((o for o in orders if str(o.ono) == ono), None)
         if order:
-            self.view_order_detail(ono)
+            self.view_order_detail(order.ono)
         else:
             print("Invalid order number.")
-
+    
     def view_order_detail(self, ono):
         try:
-            # Get order header
-            self.cursor.execute(
-                "SELECT ono, odate, shipping_address FROM orders WHERE ono = ?",
-                (ono,)
-            )
-            order = self.cursor.fetchone()
+            order = self.service.order_detail(self.session, ono)
             
             if not order:
                 print("Order not found.")
                 return
             
-            # Get order lines
-            self.cursor.execute(
-                """SELECT p.name, p.category, ol.qty, ol.uprice,
-                        (ol.qty * ol.uprice) as line_total
-                FROM orderlines ol
-                JOIN products p ON ol.pid = p.pid
-                WHERE ol.ono = ?
-                ORDER BY ol.lineNo""",
-                (ono,)
-            )
-            lines = self.cursor.fetchall()
-            
             # Display order header
             print("\n" + "="*70)
-            print(f"ORDER DETAILS - Order #{order['ono']}")
+            print(f"ORDER DETAILS - Order #{order.ono}")
             print("="*70)
-            print(f"Order Date: {order['odate']}")
-            print(f"Shipping Address: {order['shipping_address']}")
+            print(f"Order Date: {order.odate}")
+            print(f"Shipping Address: {order.shipping_address}")
             print("="*70)
             
             # Display line items
-            grand_total = 0
             print("\nITEMS:")
             print("-" * 70)
             
-            for line in lines:
-                print(f"\n{line['name']} ({line['category']})")
-                print(f"  Quantity: {line['qty']}")
-                print(f"  Unit Price: ${line['uprice']:.2f}")
-                print(f"  Line Total: ${line['line_total']:.2f}")
-                grand_total += line['line_total']
+            for line in order.lines:
+                print(f"\n{line.name} ({line.category})")
+                print(f"  Quantity: {line.qty}")
+                print(f"  Unit Price: ${line.uprice:.2f}")
+                print(f"  Line Total: ${line.total:.2f}")
             
             # Display footer
             print("\n" + "="*70)
-            print(f"GRAND TOTAL: ${grand_total:.2f}")
+            print(f"GRAND TOTAL: ${order.total:.2f}")
             print("="*70)
             
             input("\nPress Enter to continue...")
-            
+        
         except sqlite3.Error as e:
             print(f"Order detail error: {e}")
 
@@ -744,10 +576,7 @@ class ECommerceSystem:
         
         try:
             # Get product details
-            self.cursor.execute(
-                "SELECT * FROM products WHERE pid = ?", (pid,)
-            )
-            product = self.cursor.fetchone()
+            product = self.service.product_info(self.session, pid)
             
             if not product:
                 print(f"Product '{pid}' not found.")
@@ -757,12 +586,12 @@ class ECommerceSystem:
             print("\n" + "="*60)
             print("PRODUCT INFORMATION")
             print("="*60)
-            print(f"ID: {product['pid']}")
-            print(f"Name: {product['name']}")
-            print(f"Category: {product['category']}")
-            print(f"Price: ${product['price']:.2f}")
-            print(f"Stock: {product['stock_count']} units")
-            print(f"Description: {product['descr']}")
+            print(f"ID: {product.pid}")
+            print(f"Name: {product.name}")
+            print(f"Category: {product.category}")
+            print(f"Price: ${product.price:.2f}")
+            print(f"Stock: {product.stock_count} units")
+            print(f"Description: {product.descr}")
             print("="*60)
             
             # Update options
@@ -773,17 +602,19 @@ class ECommerceSystem:
             choice = input("\nChoice: ").strip()
             
             if choice == '1':
-                self.update_product_price(pid, product['name'])
+                self.update_product_price(pid, product.name)
             elif choice == '2':
-                self.update_product_stock(pid, product['name'])
+                self.update_product_stock(pid, product.name)
             elif choice == '3':
                 return
             else:
                 print("Invalid choice.")
         
+        except ServiceError as e:
+            print(e)
         except sqlite3.Error as e:
             print(f"Product error: {e}")
-
+    
     def update_product_price(self, pid, product_name):
         """Update product price"""
         new_price_str = input(f"\nEnter new price for {product_name}: $").strip()
@@ -802,21 +633,16 @@ class ECommerceSystem:
                 print("Price update cancelled.")
                 return
             
-            # Update price
-            self.cursor.execute(
-                "UPDATE products SET price = ? WHERE pid = ?",
-                (new_price, pid)
-            )
-            self.conn.commit()
-            
+            self.service.update_price(self.session, pid, new_price)
             print(f"Price updated to ${new_price:.2f}!")
-            
+        
         except ValueError:
             print("Invalid price. Please enter a number.")
+        except ServiceError as e:
+            print(e)
         except sqlite3.Error as e:
             print(f"Update error: {e}")
-            self.conn.rollback()
-
+    
     def update_product_stock(self, pid, product_name):
         """Update product stock"""
         new_stock_str = input(f"\nEnter new stock count for {product_name}: ").strip()
@@ -835,79 +661,58 @@ class ECommerceSystem:
                 print("Stock update cancelled.")
                 return
             
-            # Update stock
-            self.cursor.execute(
-                "UPDATE products SET stock_count = ? WHERE pid = ?",
-                (new_stock, pid)
-            )
-            self.conn.commit()
-            
+            self.service.update_stock(self.session, pid, new_stock)
             print(f"Stock updated to {new_stock} units!")
-            
+        
         except ValueError:
             print("Invalid stock count. Please enter a number.")
+        except ServiceError as e:
+            print(e)
         except sqlite3.Error as e:
             print(f"Update error: {e}")
-            self.conn.rollback()
-
+    
     def sales_report(self):
         """Generate weekly sales report (last 7 days)"""
+        self.print_sales_report("WEEKLY SALES REPORT", None, None)
+    
+    def range_sales_report(self):
+        """Sales report for any date range"""
+        start = input("\nStart date (YYYY-MM-DD): ").strip()
+        end = input("End date (YYYY-MM-DD, blank for today): ").strip()
+        
         try:
-            # Calculate date 7 days ago
-            week_ago = (datetime.now() - timedelta(days=7)).date().isoformat()
+            start = datetime.strptime(start, "%Y-%m-%d").date().isoformat()
+            end = datetime.strptime(end, "%Y-%m-%d").date().isoformat() if end else None
+        except ValueError:
+            print("Invalid date. Please use YYYY-MM-DD.")
+            return
+        
+        self.print_sales_report("SALES REPORT", start, end)
+    
+    def print_sales_report(self, title, start, end):
+        try:
+            report = self.service.sales_report(self.session, start, end)
             
             print("\n" + "="*60)
-            print("WEEKLY SALES REPORT")
-            print(f"Period: Last 7 days (since {week_ago})")
+            print(title)
+            if start is None:
+                print(f"Period: Last 7 days (since {report.start})")
+            else:
+                print(f"Period: {report.start} to {report.end}")
             print("="*60)
             
-            # 1. Distinct orders
-            self.cursor.execute(
-                "SELECT COUNT(DISTINCT ono) as count FROM orders WHERE odate >= ?",
-                (week_ago,)
-            )
-            order_count = self.cursor.fetchone()['count']
-            
-            # 2. Distinct products sold
-            self.cursor.execute(
-                """SELECT COUNT(DISTINCT ol.pid) as count
-                FROM orderlines ol
-                JOIN orders o ON ol.ono = o.ono
-                WHERE o.odate >= ?""",
-                (week_ago,)
-            )
-            product_count = self.cursor.fetchone()['count']
-            
-            # 3. Distinct customers
-            self.cursor.execute(
-                "SELECT COUNT(DISTINCT cid) as count FROM orders WHERE odate >= ?",
-                (week_ago,)
-            )
-            customer_count = self.cursor.fetchone()['count']
-            
-            # 4. Total sales
-            self.cursor.execute(
-                """SELECT COALESCE(SUM(ol.qty * ol.uprice), 0) as total
-                FROM orderlines ol
-                JOIN orders o ON ol.ono = o.ono
-                WHERE o.odate >= ?""",
-                (week_ago,)
-            )
-            total_sales = self.cursor.fetchone()['total']
-            
-            # 5. Average per customer
-            avg_per_customer = total_sales / customer_count if customer_count > 0 else 0
-            
             # Display report
-            print(f"\nDistinct Orders: {order_count}")
-            print(f"Distinct Products Sold: {product_count}")
-            print(f"Distinct Customers: {customer_count}")
-            print(f"Average per Customer: ${avg_per_customer:.2f}")
-            print(f"Total Sales: ${total_sales:.2f}")
+            print(f"\nDistinct Orders: {report.orders}")
+            print(f"Distinct Products Sold: {report.products}")
+            print(f"Distinct Customers: {report.customers}")
+            print(f"Average per Customer: ${report.avg_per_customer:.2f}")
+            print(f"Total Sales: ${report.revenue:.2f}")
             print("="*60)
             
             input("\nPress Enter to continue...")
-            
+        
+        except ServiceError as e:
+            print(e)
         except sqlite3.Error as e:
             print(f"Report error: {e}")
 
@@ -915,6 +720,8 @@ class ECommerceSystem:
     def top_products(self):
         """Display top-selling products"""
         try:
+            top = self.service.top_products(self.session)
+            
             print("\n" + "="*60)
             print("TOP-SELLING PRODUCTS")
             print("="*60)
@@ -923,27 +730,11 @@ class ECommerceSystem:
             print("\nTOP 3 BY NUMBER OF ORDERS:")
             print("-" * 60)
             
-            # First, get the count of the 3rd ranked product
-            self.cursor.execute("""
-                SELECT pid, name, category, order_count
-                FROM (
-                    SELECT p.pid, p.name, p.category, 
-                        COUNT(DISTINCT ol.ono) as order_count,
-                        RANK() OVER (ORDER BY COUNT(DISTINCT ol.ono) DESC) as rank
-                    FROM products p
-                    JOIN orderlines ol ON p.pid = ol.pid
-                    GROUP BY p.pid
-                )
-                WHERE rank <= 3
-                ORDER BY order_count DESC, name
-            """)
-            top_orders = self.cursor.fetchall()
-            
-            if top_orders:
-                for i, p in enumerate(top_orders, 1):
-                    print(f"{i}. {p['name']} (ID: {p['pid']})")
-                    print(f"   Category: {p['category']}")
-                    print(f"   Appears in {p['order_count']} order(s)\n")
+            if top.by_orders:
+                for i, p in enumerate(top.by_orders, 1):
+                    print(f"{i}. {p.name} (ID: {p.pid})")
+                    print(f"   Category: {p.category}")
+                    print(f"   Appears in {p.count} order(s)\n")
             else:
                 print("   No orders yet.\n")
             
@@ -951,44 +742,123 @@ class ECommerceSystem:
             print("TOP 3 BY NUMBER OF VIEWS:")
             print("-" * 60)
             
-            # First, get the count of the 3rd ranked product by views
-            self.cursor.execute("""
-                SELECT pid, name, category, view_count
-                FROM (
-                    SELECT p.pid, p.name, p.category, 
-                        COUNT(*) as view_count,
-                        RANK() OVER (ORDER BY COUNT(*) DESC) as rank
-                    FROM products p
-                    JOIN viewedProduct vp ON p.pid = vp.pid
-                    GROUP BY p.pid
-                )
-                WHERE rank <= 3
-                ORDER BY view_count DESC, name
-            """)
-            top_views = self.cursor.fetchall()
-            
-            if top_views:
-                for i, p in enumerate(top_views, 1):
-                    print(f"{i}. {p['name']} (ID: {p['pid']})")
-                    print(f"   Category: {p['category']}")
-                    print(f"   Viewed {p['view_count']} time(s)\n")
+            if top.by_views:
+                for i, p in enumerate(top.by_views, 1):
+                    print(f"{i}. {p.name} (ID: {p.pid})")
+                    print(f"   Category: {p.category}")
+                    print(f"   Viewed {p.count} time(s)\n")
             else:
                 print("   No product views yet.\n")
             
             print("="*60)
             input("\nPress Enter to continue...")
-            
+        
+        except ServiceError as e:
+            print(e)
         except sqlite3.Error as e:
             print(f"Top products error: {e}")
+    
+    def import_products(self):
+        """Apply a CSV or JSON lines product file (upsert by pid)"""
+        print("\n=== IMPORT PRODUCTS ===")
+        print("CSV with a header row, or .jsonl with one product per line.")
+        print("Rows with name, price and stock_count add or update a product,")
+        print("other rows (e.g. pid,price,stock_count) update existing products.")
+        path = input("File: ").strip()
+        if not path:
+            return
+        
+        try:
+            result = self.service.import_products(self.session, path, progress=print_progress)
+        except ServiceError as e:
+            print(e)
+            return
+        except sqlite3.Error as e:
+            print(f"\nImport error: {e}")
+            return
+        
+        print(f"\nImported {result.applied:,} of {result.rows:,} rows in "
+              f"{result.seconds:.1f}s ({result.rows_per_sec:,.0f} rows/sec)")
+        if result.not_found:
+            print(f"{result.not_found:,} rows matched no product")
+        if result.error_count:
+            print(f"{result.error_count:,} rows had errors:")
+            for error in result.errors[:20]:
+                print(f"  {error}")
+    
+    def export_products(self):
+        """Write every product to a CSV or JSON lines file"""
+        print("\n=== EXPORT PRODUCTS ===")
+        path = input("File (.csv or .jsonl): ").strip()
+        if not path:
+            return
+        
+        try:
+            result = self.service.export_products(self.session, path, progress=print_progress)
+        except ServiceError as e:
+            print(e)
+            return
+        except sqlite3.Error as e:
+            print(f"\nExport error: {e}")
+            return
+        
+        print(f"\nExported {result.rows:,} products in {result.seconds:.1f}s "
+              f"({result.rows_per_sec:,.0f} rows/sec)")
+    
+    def query_statistics(self):
+        """Display the busiest statements, slow queries and cache hit ratios"""
+        try:
+            report = self.service.query_report(self.session)
+        except ServiceError as e:
+            print(e)
+            return
+        
+        print("\n" + "="*60)
+        print("QUERY STATISTICS")
+        print("="*60)
+        print(format_report(self.db.query_stats))
+        
+        cache = report.product_cache
+        print(f"\nProduct cache: {cache['hits']} hits, {cache['misses']} misses "
+              f"({cache['hit_ratio']:.0%}), {cache['size']}/{cache['max_size']} rows")
+        cache = report.search_cache
+        print(f"Search cache: {cache['hits']} hits, {cache['misses']} misses "
+              f"({cache['hit_ratio']:.0%}), {cache['size']}/{cache['max_size']} searches, "
+              f"{cache['invalidations']} catalog changes")
+        completer = report.autocomplete
+        print(f"Autocomplete: {completer['words']} words, {completer['queries']} queries, "
+              f"{completer['memory_bytes'] / 1024:.0f} KB, {completer['lookups']} lookups")
+        activity = report.activity
+        print(f"Activity log: {activity['flushed']} views/searches written in "
+              f"{activity['batches']} batches, {activity['dropped']} dropped")
+        print("="*60)
+        input("\nPress Enter to continue...")
+    
+    def write_query_report(self, file_name):
+        """Save the query statistics to a file, done at exit"""
+        try:
+            with open(file_name, "w", encoding="utf-8") as f:
+                f.write(f"Query statistics at {datetime.now().isoformat(timespec='seconds')}\n\n")
+                f.write(format_report(self.db.query_stats, limit=25) + "\n")
+                f.write(f"\nProduct cache: {self.service.products.stats()}\n")
+                f.write(f"Search cache: {self.service.search_cache.stats()}\n")
+                f.write(f"Activity log: {self.service.activity.stats()}\n")
+        except OSError as e:
+            print(f"Could not write query report: {e}")
 
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python3 main.py <database_file>")
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python3 main.py <database_file> [query_report_file]")
         sys.exit(1)
     
     db_name = sys.argv[1]
-    system = ECommerceSystem(db_name)
+    report_file = sys.argv[2] if len(sys.argv) == 3 else None
+    try:
+        system = ECommerceSystem(db_name)
+    except sqlite3.Error as e:
+        print(f"Could not open {db_name}: {e}")
+        sys.exit(1)
     
     try:
         while True:
@@ -1015,8 +885,10 @@ def main():
             else:
                 print("Invalid choice.")
     finally:
+        if report_file:
+            system.write_query_report(report_file)
         system.close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,205 @@
+import sqlite3
+
+import leaderboards
+import recommendations
+import rollups
+import search_index
+
+# Schema migrations, applied in order. PRAGMA user_version stores how many
+# have been applied to a database file, so each one runs exactly once.
+# An entry is either an SQL script or a function taking the connection.
+MIGRATIONS = [
+    # 1: indexes for the hot query paths in main.py
+    """
+    -- login: SELECT uid, role FROM users WHERE uid = ? AND pwd = ?
+    CREATE INDEX IF NOT EXISTS idx_users_login ON users (uid, pwd, role);
+
+    -- register: email uniqueness check
+    CREATE INDEX IF NOT EXISTS idx_customers_email ON customers (email);
+
+    -- search: ORDER BY name with the (name, pid) keyset seek
+    CREATE INDEX IF NOT EXISTS idx_products_name ON products (name, pid);
+
+    -- view_orders: WHERE cid = ? ORDER BY odate DESC, ono DESC
+    CREATE INDEX IF NOT EXISTS idx_orders_cid_odate
+        ON orders (cid, odate, ono, shipping_address);
+
+    -- sales_report: odate range scan, counts distinct ono and cid
+    CREATE INDEX IF NOT EXISTS idx_orders_odate ON orders (odate, ono, cid);
+
+    -- sales_report joins lines by ono, top_products groups them by pid
+    CREATE INDEX IF NOT EXISTS idx_orderlines_ono_cover
+        ON orderlines (ono, pid, qty, uprice);
+    CREATE INDEX IF NOT EXISTS idx_orderlines_pid ON orderlines (pid, ono);
+
+    -- top_products: views grouped by pid
+    CREATE INDEX IF NOT EXISTS idx_viewed_pid ON viewedProduct (pid);
+
+    ANALYZE;
+    """,
+
+    # 2: id sequences, replacing SELECT MAX(CAST(x AS INTEGER)) + 1
+    """
+    CREATE TABLE IF NOT EXISTS sequences (
+        name    text primary key,
+        next_id int not null
+    );
+
+    -- cid references users, so customers share the uid sequence
+    INSERT OR REPLACE INTO sequences (name, next_id)
+    SELECT 'users', MAX(
+        COALESCE((SELECT MAX(CAST(uid AS INTEGER)) FROM users), 0),
+        COALESCE((SELECT MAX(CAST(cid AS INTEGER)) FROM customers), 0)
+    ) + 1;
+
+    INSERT OR REPLACE INTO sequences (name, next_id)
+    SELECT 'orders', COALESCE(MAX(CAST(ono AS INTEGER)), 0) + 1 FROM orders;
+    """,
+]
+
+
+def create_sales_rollups(conn):
+    rollups.create_tables(conn)
+    rollups.rebuild(conn)
+
+
+# 3: daily sales rollups for sales_report, filled from existing orders
+MIGRATIONS.append(create_sales_rollups)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply any pending migrations, returns the resulting schema version"""
+    version = schema_version(conn)
+
+    for number in range(version + 1, len(MIGRATIONS) + 1):
+        step = MIGRATIONS[number - 1]
+        try:
+            conn.execute("BEGIN")
+            if callable(step):
+                step(conn)
+            else:
+                for statement in split_statements(step):
+                    conn.execute(statement)
+            # PRAGMA doesn't accept parameters, number is always an int here
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+    return schema_version(conn)
+
+
+def split_statements(script):
+    """Split an SQL script into complete statements"""
+    statements = []
+    current = ""
+    for line in script.splitlines(keepends=True):
+        if line.strip().startswith("--"):
+            continue
+        current += line
+        if sqlite3.complete_statement(current):
+            statements.append(current.strip())
+            current = ""
+    if current.strip():
+        statements.append(current.strip())
+    return statements
+
+
+def create_leaderboards(conn):
+    leaderboards.create_tables(conn)
+    leaderboards.rebuild(conn)
+
+
+# 4: per-product order/view counters for top_products
+MIGRATIONS.append(create_leaderboards)
+
+
+# 5: catalog version for the search result cache, bumped by any connection
+# that adds, removes or renames/recategorizes products (not price or stock)
+MIGRATIONS.append("""
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id      int primary key check (id = 1),
+    version int not null
+);
+INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS catalog_version_insert
+AFTER INSERT ON products BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS catalog_version_update
+AFTER UPDATE OF pid, name, descr, category ON products BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS catalog_version_delete
+AFTER DELETE ON products BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END;
+""")
+
+
+# 6: search filters and sorts: category equality, price ranges and price
+# order are range scans on these instead of scans of products
+MIGRATIONS.append("""
+CREATE INDEX IF NOT EXISTS idx_products_category_name ON products (category, name, pid);
+CREATE INDEX IF NOT EXISTS idx_products_category_price ON products (category, price, pid);
+CREATE INDEX IF NOT EXISTS idx_products_price ON products (price, pid);
+ANALYZE;
+""")
+
+
+def create_recommendations(conn):
+    recommendations.create_tables(conn)
+    recommendations.update(conn, full=True)
+
+
+# 7: "customers also bought" recommendations, built from existing orders
+MIGRATIONS.append(create_recommendations)
+
+
+def rekey_recommendations(conn):
+    # The watermark was the last ono, compared as text where ono is text
+    conn.execute("DROP TABLE IF EXISTS recommendation_state")
+    recommendations.create_tables(conn)
+    recommendations.update(conn, full=True)
+
+
+# 8: recommendations watermark on orders.rowid, rebuilt from every order
+MIGRATIONS.append(rekey_recommendations)
+
+
+def create_search_index(conn):
+    try:
+        search_index.create_tables(conn)
+    except sqlite3.OperationalError as e:
+        # Without FTS5 / the trigram tokenizer search keeps the LIKE scan,
+        # anything else (a locked or read-only file) is a real failure
+        if not search_index.fts_unavailable(e):
+            raise
+        return
+    search_index.rebuild(conn)
+
+
+# 9: FTS5 keyword index on products and its sync triggers, created here
+# instead of on every startup, filled from every product
+MIGRATIONS.append(create_search_index)
+
+
+# 10: in-stock-only searches in name or price order walk these partial
+# indexes, which hold only the products with stock_count > 0. stock_count
+# makes the name one covering for the pager's COUNT(*); stock updates
+# already have to touch both because of the WHERE.
+MIGRATIONS.append("""
+CREATE INDEX IF NOT EXISTS idx_products_in_stock_name
+    ON products (name, pid, stock_count) WHERE stock_count > 0;
+CREATE INDEX IF NOT EXISTS idx_products_in_stock_price
+    ON products (price, pid) WHERE stock_count > 0;
+ANALYZE;
+""")
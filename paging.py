@@ -0,0 +1,83 @@
+class KeysetPager:
+    """Lazy page-by-page view of a query result
+
+    Instead of fetchall() + slicing, each page is fetched with a seek on the
+    sort key, e.g. WHERE (name, pid) > (?, ?) ORDER BY name, pid LIMIT n+1,
+    on a pooled reader connection from db (a Database).
+    Only the current page and the start key of each visited page are kept
+    in memory. The extra row tells us whether there is a next page.
+
+    keys is a list of (sql_expression, row_column) pairs making up a unique
+    sort key, e.g. [("o.odate", "odate"), ("o.ono", "ono")].
+    """
+
+    def __init__(self, db, select, where, params, keys,
+                 group_by="", descending=False, page_size=5):
+        self.db = db
+        self.select = select
+        self.where = where or "1"
+        self.params = list(params)
+        self.keys = keys
+        self.group_by = group_by
+        self.descending = descending
+        self.page_size = page_size
+
+        # Start key of every page we have visited, None for the first page
+        self.starts = [None]
+        self.rows = []
+        self.has_next = False
+        self.total = None
+
+    @property
+    def page_no(self):
+        return len(self.starts) - 1
+
+    def count(self):
+        """Total number of rows, computed once with COUNT(*)"""
+        if self.total is None:
+            query = f"""SELECT COUNT(*) FROM (
+                {self.select} WHERE {self.where} {self.group_by})"""
+            self.total = self.db.query_one(query, self.params)[0]
+        return self.total
+
+    def total_pages(self):
+        return max(1, (self.count() + self.page_size - 1) // self.page_size)
+
+    def load(self):
+        """Fetch the current page, returns its rows"""
+        key_exprs = ", ".join(expr for expr, _ in self.keys)
+        direction = "DESC" if self.descending else "ASC"
+        order_by = ", ".join(f"{expr} {direction}" for expr, _ in self.keys)
+
+        where = f"({self.where})"
+        params = list(self.params)
+        start = self.starts[-1]
+        if start is not None:
+            op = "<" if self.descending else ">"
+            placeholders = ", ".join("?" for _ in start)
+            where += f" AND ({key_exprs}) {op} ({placeholders})"
+            params.extend(start)
+
+        query = f"""{self.select}
+            WHERE {where}
+            {self.group_by}
+            ORDER BY {order_by}
+            LIMIT ?"""
+        params.append(self.page_size + 1)
+
+        rows = self.db.query(query, params)
+        self.has_next = len(rows) > self.page_size
+        self.rows = rows[:self.page_size]
+        return self.rows
+
+    def next(self):
+        if not self.has_next:
+            return self.rows
+        last = self.rows[-1]
+        self.starts.append(tuple(last[column] for _, column in self.keys))
+        return self.load()
+
+    def prev(self):
+        if len(self.starts) > 1:
+            self.starts.pop()
+        return self.load()
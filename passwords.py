@@ -0,0 +1,93 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+
+# Stored password formats:
+#   scrypt$<log2 n>$<r>$<p>$<salt>$<hash>
+#   pbkdf2_sha256$<iterations>$<salt>$<hash>
+# salt and hash are base64. Anything else is a legacy plaintext password,
+# which verify() still accepts and needs_rehash() reports so login can
+# replace it with a hash.
+
+ALGORITHMS = ('scrypt', 'pbkdf2_sha256')
+DEFAULT_COST = {'scrypt': 14, 'pbkdf2_sha256': 600000}
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+
+def b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+class PasswordHasher:
+    """Hashes and checks passwords with scrypt or PBKDF2 from hashlib
+
+    cost is log2 of scrypt's n, or the number of PBKDF2 iterations; each
+    +1 on scrypt roughly doubles the time and memory of a login. The key
+    derivation runs on the calling thread; hashlib releases the GIL while
+    it works, so callers bound how many run at once by choosing the
+    thread (the server hashes on its own auth_pool).
+    """
+
+    def __init__(self, algorithm='scrypt', cost=None):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"algorithm must be one of {ALGORITHMS}")
+        self.algorithm = algorithm
+        self.cost = cost or DEFAULT_COST[algorithm]
+        self.dummy = None
+
+    def dummy_hash(self):
+        """Checked when the user doesn't exist, so that takes as long as a wrong password"""
+        # Made on first use rather than at startup, it costs as much as a
+        # login. Two threads racing here just both make a valid one.
+        if self.dummy is None:
+            self.dummy = self.hash(secrets.token_hex(8))
+        return self.dummy
+
+    def hash(self, password):
+        salt = os.urandom(SALT_BYTES)
+        key = self.derive(password, salt, self.algorithm, self.cost)
+        if self.algorithm == 'scrypt':
+            return f"scrypt${self.cost}${SCRYPT_R}${SCRYPT_P}${b64(salt)}${b64(key)}"
+        return f"pbkdf2_sha256${self.cost}${b64(salt)}${b64(key)}"
+
+    def verify(self, password, stored):
+        """True if password matches the stored hash (or legacy plaintext)"""
+        if stored is None:
+            stored = self.dummy_hash()
+        parts = stored.split("$")
+
+        try:
+            if parts[0] == 'scrypt' and len(parts) == 6:
+                cost, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+                salt, expected = base64.b64decode(parts[4]), base64.b64decode(parts[5])
+                key = self.derive(password, salt, 'scrypt', cost, r, p)
+            elif parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+                salt, expected = base64.b64decode(parts[2]), base64.b64decode(parts[3])
+                key = self.derive(password, salt, 'pbkdf2_sha256', int(parts[1]))
+            else:
+                return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+        except ValueError:
+            return False
+
+        return hmac.compare_digest(key, expected)
+
+    def needs_rehash(self, stored):
+        """True for plaintext or for hashes made with another algorithm or cost"""
+        parts = stored.split("$")
+        if self.algorithm == 'scrypt':
+            return parts[:4] != ['scrypt', str(self.cost), str(SCRYPT_R), str(SCRYPT_P)]
+        return parts[:2] != ['pbkdf2_sha256', str(self.cost)]
+
+    def derive(self, password, salt, algorithm, cost, r=SCRYPT_R, p=SCRYPT_P):
+        """Derive the key for these parameters on the calling thread"""
+        password = password.encode("utf-8")
+        if algorithm == 'scrypt':
+            n = 1 << cost
+            return hashlib.scrypt(password, salt=salt, n=n, r=r, p=p,
+                                  maxmem=256 * n * r + (1 << 20), dklen=HASH_BYTES)
+        return hashlib.pbkdf2_hmac("sha256", password, salt, cost, HASH_BYTES)
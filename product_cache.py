@@ -0,0 +1,105 @@
+import threading
+from collections import OrderedDict
+
+PRODUCT_COLUMNS = "pid, name, category, price, stock_count, descr"
+
+
+class ProductCache:
+    """In-process LRU cache of products rows keyed by pid
+
+    Writers in this process call invalidate(pid) after changing a product
+    (price/stock updates, checkout). Changes committed by other processes
+    are noticed through Database.external_version(), which leaves out
+    this process's own commits and never waits for the write lock; then
+    the whole cache is dropped.
+    """
+
+    def __init__(self, db, max_size=1024):
+        self.db = db
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.rows = OrderedDict()
+        self.data_version = None
+        # Bumped on every invalidation, so a row read before an invalidation
+        # is not put back into the cache afterwards
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, pid):
+        """Return the products row for pid, or None if there is no such product"""
+        return self.get_many([pid]).get(str(pid))
+
+    def get_many(self, pids):
+        """Return {str(pid): row} for the given pids, loading misses in one query"""
+        self.check_data_version()
+
+        found = {}
+        missing = []
+        with self.lock:
+            generation = self.generation
+            for pid in pids:
+                key = str(pid)
+                if key in self.rows:
+                    self.rows.move_to_end(key)
+                    found[key] = self.rows[key]
+                    self.hits += 1
+                else:
+                    missing.append(pid)
+                    self.misses += 1
+
+        if missing:
+            placeholders = ", ".join("?" for _ in missing)
+            rows = self.db.query(
+                f"SELECT {PRODUCT_COLUMNS} FROM products WHERE pid IN ({placeholders})",
+                missing
+            )
+            with self.lock:
+                for row in rows:
+                    key = str(row['pid'])
+                    found[key] = row
+                    if generation == self.generation:
+                        self.rows[key] = row
+                        self.rows.move_to_end(key)
+                while len(self.rows) > self.max_size:
+                    self.rows.popitem(last=False)
+                    self.evictions += 1
+
+        return found
+
+    def invalidate(self, *pids):
+        with self.lock:
+            self.generation += 1
+            for pid in pids:
+                if self.rows.pop(str(pid), None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.invalidations += len(self.rows)
+            self.rows.clear()
+
+    def check_data_version(self):
+        """Drop everything if another process has committed since the last check"""
+        version = self.db.external_version()
+        if version != self.data_version:
+            if self.data_version is not None:
+                self.clear()
+            self.data_version = version
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.rows),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
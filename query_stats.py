@@ -0,0 +1,208 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+
+# Statement shape: the SQL with literals replaced by ? and IN lists
+# collapsed, so "pid IN (?, ?)" and "pid IN (?, ?, ?)" count as one
+# statement and so do queries built with different literal values.
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+SPACES = re.compile(r"\s+")
+# Parameters of statements on users carry password hashes (or legacy
+# plaintext passwords), the slow log leaves them out
+SECRET_TABLES = re.compile(r"\busers\b", re.IGNORECASE)
+
+
+def statement_shape(sql):
+    shape = SPACES.sub(" ", sql).strip()
+    shape = LITERALS.sub("?", shape)
+    return IN_LIST.sub("(?, ...)", shape)
+
+
+@dataclass
+class StatementStats:
+    shape: str
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+
+@dataclass
+class SlowQuery:
+    when: str
+    ms: float
+    sql: str
+    params: str
+    plan: list
+
+
+class QueryStats:
+    """Per-statement-shape counts and latencies for every connection of a Database
+
+    Latency covers execute() plus the fetches that follow it. Statements
+    whose execute() takes longer than slow_ms are kept in a slow log
+    (the last max_slow of them) with their EXPLAIN QUERY PLAN, and are
+    appended to log_file if one is given.
+    """
+
+    def __init__(self, slow_ms=50.0, max_slow=100, log_file=None):
+        self.slow_ms = slow_ms
+        self.log_file = log_file
+        self.lock = threading.Lock()
+        self.statements = {}
+        self.slow = deque(maxlen=max_slow)
+        # SQL text -> shape, the regexes cost more than most statements
+        self.shapes = {}
+
+    def record(self, sql, seconds, rows=0):
+        shape = self.shapes.get(sql)
+        if shape is None:
+            shape = statement_shape(sql)
+            if len(self.shapes) < 10000:
+                self.shapes[sql] = shape
+        ms = seconds * 1000
+        with self.lock:
+            stats = self.statements.get(shape)
+            if stats is None:
+                stats = self.statements[shape] = StatementStats(shape)
+            stats.count += 1
+            stats.total_ms += ms
+            stats.max_ms = max(stats.max_ms, ms)
+            stats.rows += rows
+        return stats
+
+    def add_fetch(self, stats, seconds, rows):
+        with self.lock:
+            stats.total_ms += seconds * 1000
+            stats.rows += rows
+
+    def record_slow(self, conn, sql, params, seconds):
+        try:
+            # The plain sqlite3 execute, so the EXPLAIN itself isn't counted
+            plan = [row[3] for row in sqlite3.Connection.execute(
+                conn, f"EXPLAIN QUERY PLAN {sql}", params)]
+        except sqlite3.Error as e:
+            plan = [f"(no plan: {e})"]
+
+        shown = "(hidden)" if SECRET_TABLES.search(sql) else repr(params)[:200]
+        entry = SlowQuery(datetime.now().isoformat(timespec='seconds'), seconds * 1000,
+                          SPACES.sub(" ", sql).strip(), shown, plan)
+        with self.lock:
+            self.slow.append(entry)
+            if self.log_file:
+                with open(self.log_file, "a", encoding="utf-8") as f:
+                    f.write(f"{entry.when} {entry.ms:.1f}ms {entry.sql} {entry.params}\n")
+                    for line in plan:
+                        f.write(f"    {line}\n")
+
+    def top(self, limit=20, key='total_ms'):
+        """The statement shapes with the highest total (or count, max_ms...)"""
+        with self.lock:
+            stats = [StatementStats(s.shape, s.count, s.total_ms, s.max_ms, s.rows)
+                     for s in self.statements.values()]
+        stats.sort(key=lambda s: getattr(s, key), reverse=True)
+        return stats[:limit]
+
+    def slow_queries(self):
+        with self.lock:
+            return list(self.slow)
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+            self.slow.clear()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement and the rows fetched from it"""
+
+    stats = None
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self.finish(sql, params, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_params):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            self.finish(sql, None, time.perf_counter() - start)
+
+    def finish(self, sql, params, seconds):
+        query_stats = self.connection.query_stats
+        rows = self.rowcount if self.rowcount > 0 else 0
+        self.stats = query_stats.record(sql, seconds, rows)
+        if seconds * 1000 >= query_stats.slow_ms and params is not None:
+            query_stats.record_slow(self.connection, sql, params, seconds)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.fetched(time.perf_counter() - start, 1 if row is not None else 0)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(size if size is not None else self.arraysize)
+        self.fetched(time.perf_counter() - start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.fetched(time.perf_counter() - start, len(rows))
+        return rows
+
+    def fetched(self, seconds, rows):
+        if self.stats is not None:
+            self.connection.query_stats.add_fetch(self.stats, seconds, rows)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection factory whose statements go through InstrumentedCursor
+
+    The C execute() shortcuts call the cursor's C methods directly, so they
+    are routed through cursor() here. Set query_stats after connecting.
+    """
+
+    query_stats = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+def format_report(stats, limit=10):
+    """Text report of a QueryStats for the terminal or a log"""
+    lines = [f"{'count':>8} {'total ms':>10} {'avg ms':>8} {'max ms':>8} {'rows':>8}  statement"]
+    for s in stats.top(limit):
+        shape = s.shape if len(s.shape) <= 90 else s.shape[:87] + "..."
+        lines.append(f"{s.count:>8} {s.total_ms:>10.1f} {s.avg_ms:>8.2f} "
+                     f"{s.max_ms:>8.2f} {s.rows:>8}  {shape}")
+
+    slow = stats.slow_queries()
+    lines.append("")
+    lines.append(f"Slow queries (over {stats.slow_ms:g} ms): {len(slow)}")
+    for q in slow[-limit:]:
+        lines.append(f"  {q.when} {q.ms:.1f} ms  {q.sql[:100]}")
+        for step in q.plan:
+            lines.append(f"      {step}")
+    return "\n".join(lines)
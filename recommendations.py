@@ -0,0 +1,141 @@
+import sqlite3
+import sys
+from collections import Counter
+from itertools import combinations, groupby
+
+# "Customers also bought" recommendations from orderlines.
+#   co_purchases          (pid, other) -> number of orders containing both
+#   recommendations       the top TOP_K others for each pid, ranked 1..K
+#   recommendation_state  the orders.rowid of the last order folded in
+# update() streams the orderlines of orders newer than the last run,
+# ordered by the orders rowid so each order's lines arrive together, counts
+# the product pairs of each order and re-ranks only the products whose
+# counts moved. The watermark is the rowid, not ono: ono is text in older
+# databases ('10' < '9'), while rowids only grow as orders are inserted
+# (an order and its lines commit together, and orders are never deleted).
+# The detail page reads one pid's ranked rows from the primary key.
+
+TOP_K = 10
+FLUSH_PAIRS = 50000
+
+CREATE_TABLES = [
+    # pid/other untyped like product_stats, products.pid may be int or text
+    """CREATE TABLE IF NOT EXISTS co_purchases (
+        pid     ,
+        other   ,
+        orders  int not null,
+        primary key (pid, other)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS recommendations (
+        pid     ,
+        rank    int,
+        other   not null,
+        score   int not null,
+        primary key (pid, rank)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS recommendation_state (
+        id       int primary key check (id = 1),
+        last_order int not null
+    )""",
+    "INSERT OR IGNORE INTO recommendation_state (id, last_order) VALUES (1, 0)",
+]
+
+
+def create_tables(conn):
+    for statement in CREATE_TABLES:
+        conn.execute(statement)
+
+
+def update(conn, full=False):
+    """Fold orders newer than the last run into the recommendations
+
+    full=True starts over from every order. Returns (orders, pairs) read.
+    Call inside a transaction.
+    """
+    if full:
+        conn.execute("DELETE FROM co_purchases")
+        conn.execute("DELETE FROM recommendations")
+        conn.execute("UPDATE recommendation_state SET last_order = 0")
+    last_order = conn.execute("SELECT last_order FROM recommendation_state").fetchone()[0]
+
+    # Orders by rowid, each with its lines from the (ono, pid, ...) covering index
+    lines = conn.execute(
+        """SELECT o.rowid, ol.pid FROM orders o
+        JOIN orderlines ol ON ol.ono = o.ono
+        WHERE o.rowid > ?
+        ORDER BY o.rowid""",
+        (last_order,)
+    )
+    pairs = Counter()
+    changed = set()
+    orders = pair_count = 0
+    for order, order_lines in groupby(lines, key=lambda line: line[0]):
+        pids = {line[1] for line in order_lines}
+        for a, b in combinations(pids, 2):
+            pairs[a, b] += 1
+            pairs[b, a] += 1
+        orders += 1
+        pair_count += len(pids) * (len(pids) - 1)
+        last_order = order
+        # Write out now and then so memory stays bounded on a full build
+        if len(pairs) >= FLUSH_PAIRS:
+            changed.update(flush(conn, pairs))
+
+    changed.update(flush(conn, pairs))
+    rerank(conn, changed)
+    conn.execute("UPDATE recommendation_state SET last_order = ?", (last_order,))
+    return orders, pair_count
+
+
+def flush(conn, pairs):
+    """Add the counted pairs to co_purchases, returns the pids touched"""
+    conn.executemany(
+        """INSERT INTO co_purchases (pid, other, orders) VALUES (?, ?, ?)
+        ON CONFLICT (pid, other) DO UPDATE SET orders = orders + excluded.orders""",
+        ((a, b, count) for (a, b), count in pairs.items())
+    )
+    touched = {a for a, _ in pairs}
+    pairs.clear()
+    return touched
+
+
+def rerank(conn, pids):
+    """Recompute the top TOP_K rows of recommendations for these pids"""
+    rows = [(pid,) for pid in pids]
+    conn.executemany("DELETE FROM recommendations WHERE pid = ?", rows)
+    conn.executemany(
+        """INSERT INTO recommendations (pid, rank, other, score)
+        SELECT pid, ROW_NUMBER() OVER (ORDER BY orders DESC, other), other, orders
+        FROM co_purchases WHERE pid = ?
+        ORDER BY orders DESC, other
+        LIMIT ?""",
+        ((pid, TOP_K) for pid in pids)
+    )
+
+
+def also_bought(conn, pid, limit=5):
+    """Products most often ordered together with pid, best first"""
+    return conn.execute(
+        """SELECT p.pid, p.name, p.price, r.score
+        FROM recommendations r
+        JOIN products p ON p.pid = r.other
+        WHERE r.pid = ? AND r.rank <= ?
+        ORDER BY r.rank""",
+        (pid, limit)
+    ).fetchall()
+
+
+if __name__ == "__main__":
+    # Batch job: python3 recommendations.py <db_path> [--full]
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} <db_path> [--full]")
+        sys.exit(1)
+
+    conn = sqlite3.connect(sys.argv[1])
+    create_tables(conn)
+    orders, pairs = update(conn, full="--full" in sys.argv[2:])
+    conn.commit()
+    products = conn.execute("SELECT COUNT(DISTINCT pid) FROM recommendations").fetchone()[0]
+    conn.close()
+    print(f"Recommendations updated from {orders} new orders, {pairs} product pairs "
+          f"({products} products have recommendations).")
@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Cached in place of the pid list for searches with more than max_pids
+# matches, so they go straight to the database without re-checking
+TOO_BIG = object()
+
+
+def normalize_query(query):
+    """Cache key for a search: lowercase keywords, duplicates dropped, sorted
+
+    Matching is case-insensitive and every keyword must match (AND), so
+    "DDR5 sodimm" and "sodimm  ddr5" find the same products.
+    """
+    return tuple(sorted(set(query.lower().split())))
+
+
+class SearchCache:
+    """LRU cache of search results: keywords -> every matching pid, in name order
+
+    Results only depend on product names, descriptions and categories, so
+    entries stay valid until the catalog version (catalog_version table,
+    bumped by triggers) moves; then the whole cache is dropped. Entries
+    also expire after ttl seconds. Searches matching more than max_pids
+    products are cached as TOO_BIG and paged straight from the database.
+    """
+
+    def __init__(self, max_entries=256, ttl=300.0, max_pids=2000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_pids = max_pids
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.too_big = 0
+
+    def get(self, keywords, version):
+        """The cached pid list (or TOO_BIG), None on a miss"""
+        with self.lock:
+            self.check_version(version)
+            entry = self.entries.get(keywords)
+            if entry is not None and entry[1] < time.monotonic():
+                del self.entries[keywords]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(keywords)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, keywords, version, pids):
+        """Remember the result of a search run at catalog version"""
+        with self.lock:
+            if len(pids) > self.max_pids:
+                self.too_big += 1
+                pids = TOO_BIG
+            self.check_version(version)
+            # Don't keep a result the catalog has already moved past
+            if version != self.version:
+                return
+            self.entries[keywords] = (pids, time.monotonic() + self.ttl)
+            self.entries.move_to_end(keywords)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def check_version(self, version):
+        # Called with the lock held; versions only go up
+        if self.version is None or version > self.version:
+            if self.entries:
+                self.invalidations += 1
+                self.entries.clear()
+            self.version = version
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'too_big': self.too_big,
+            }
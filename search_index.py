@@ -0,0 +1,176 @@
+import sqlite3
+import sys
+
+# Trigram tokens need at least this many characters to be matched by FTS5
+MIN_FTS_KEYWORD = 3
+
+
+def create_tables(conn):
+    """Create the products_fts shadow table and the triggers keeping it in sync
+
+    Raises sqlite3.OperationalError if this sqlite build has no FTS5 or no
+    trigram tokenizer, see fts_unavailable().
+    """
+    conn.execute(
+        """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts
+        USING fts5(name, descr, category, tokenize = 'trigram')"""
+    )
+
+    # Keep the index in sync with products no matter who writes to it.
+    # Price and stock updates don't touch the indexed columns, so the
+    # update trigger only fires for text changes.
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_insert
+        AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts (rowid, name, descr, category)
+            VALUES (new.rowid, new.name, new.descr, new.category);
+        END""")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_update
+        AFTER UPDATE OF name, descr, category ON products BEGIN
+            DELETE FROM products_fts WHERE rowid = old.rowid;
+            INSERT INTO products_fts (rowid, name, descr, category)
+            VALUES (new.rowid, new.name, new.descr, new.category);
+        END""")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS products_fts_delete
+        AFTER DELETE ON products BEGIN
+            DELETE FROM products_fts WHERE rowid = old.rowid;
+        END""")
+
+
+def fts_unavailable(error):
+    """True if error means the sqlite build can't create products_fts at all"""
+    message = str(error)
+    return "no such module: fts5" in message or "no such tokenizer: trigram" in message
+
+
+def exists(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+    ).fetchone() is not None
+
+
+def in_sync(conn, sample=20):
+    """True if the newest products rows still match their index rows
+
+    A renumbering VACUUM closes the gaps left by deleted rows, which
+    shifts the rows after them, so the newest rows are where it shows.
+    """
+    last_fts = conn.execute(
+        "SELECT rowid FROM products_fts ORDER BY rowid DESC LIMIT 1"
+    ).fetchone()
+    last = conn.execute("SELECT MAX(rowid) FROM products").fetchone()
+    if (last_fts[0] if last_fts else None) != last[0]:
+        return False
+    mismatched = conn.execute(
+        """SELECT COUNT(*) FROM (
+            SELECT rowid, name, category FROM products ORDER BY rowid DESC LIMIT ?
+        ) p
+        LEFT JOIN products_fts f ON f.rowid = p.rowid
+        WHERE f.rowid IS NULL OR f.name IS NOT p.name OR f.category IS NOT p.category""",
+        (sample,)
+    ).fetchone()[0]
+    return mismatched == 0
+
+
+def rebuild(conn):
+    """Repopulate the shadow table from products"""
+    conn.execute("DELETE FROM products_fts")
+    conn.execute(
+        """INSERT INTO products_fts (rowid, name, descr, category)
+        SELECT rowid, name, descr, category FROM products"""
+    )
+
+
+class ProductSearchIndex:
+    """Keyword search over products using an FTS5 shadow table.
+
+    The shadow table products_fts holds name, descr and category for every
+    product and is kept in sync by triggers, so inserts and edits made by
+    any connection are picked up. Both are created by a migration. Its
+    rowid is the rowid of the products row (pid is not always an integer).
+    VACUUM may renumber those, so the newest rows are spot-checked at
+    startup and the index is rebuilt if they no longer line up (or run
+    python3 search_index.py <db_path>). The trigram tokenizer gives
+    case-insensitive substring matching, the same as the old LIKE '%kw%'.
+    If the sqlite build has no FTS5 (or no trigram tokenizer) the migration
+    leaves the table out and we fall back to the plain LIKE scan.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        with db.reader() as conn:
+            self.fts_enabled = exists(conn)
+            stale = self.fts_enabled and not in_sync(conn)
+        if stale:
+            with db.transaction() as conn:
+                # Another process may have rebuilt it in the meantime
+                if not in_sync(conn):
+                    rebuild(conn)
+
+    def match_clause(self, keywords):
+        """Build a WHERE clause on products for the given keywords
+
+        Every keyword must appear in name, descr or category (AND semantics).
+        Returns (sql, params).
+        """
+        conditions = []
+        params = []
+
+        phrases = []
+        for keyword in keywords:
+            if self.fts_enabled and len(keyword) >= MIN_FTS_KEYWORD:
+                # Quote as an FTS5 phrase so punctuation is matched literally
+                phrases.append('"' + keyword.replace('"', '""') + '"')
+            else:
+                # Too short for trigrams (or no FTS5): use the LIKE scan
+                keyword_lower = f"%{keyword.lower()}%"
+                conditions.append(
+                    "(LOWER(name) LIKE ? OR LOWER(descr) LIKE ? OR LOWER(category) LIKE ?)"
+                )
+                params.extend([keyword_lower, keyword_lower, keyword_lower])
+
+        if phrases:
+            conditions.insert(
+                0, "rowid IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)"
+            )
+            params.insert(0, " AND ".join(phrases))
+
+        return " AND ".join(conditions) or "1", params
+
+    def search(self, keywords):
+        """Return all products matching the keywords, ordered by name"""
+        where_clause, params = self.match_clause(keywords)
+        return self.db.query(
+            f"""SELECT pid, name, category, price, stock_count, descr
+            FROM products
+            WHERE {where_clause}
+            ORDER BY name""",
+            params
+        )
+
+
+if __name__ == "__main__":
+    # Rebuild job: python3 search_index.py <db_path>
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} <db_path>")
+        sys.exit(1)
+
+    from database import Database
+    db = Database(sys.argv[1], readers=1)
+    try:
+        with db.transaction() as conn:
+            try:
+                # Missing if the database was migrated by a build without FTS5
+                create_tables(conn)
+            except sqlite3.OperationalError as e:
+                if not fts_unavailable(e):
+                    raise
+                print("This sqlite build has no FTS5 trigram tokenizer, nothing to rebuild.")
+                sys.exit(1)
+            rebuild(conn)
+        rows = db.query_one("SELECT COUNT(*) FROM products_fts")[0]
+    finally:
+        db.close()
+    print(f"Search index rebuilt ({rows} products).")
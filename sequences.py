@@ -0,0 +1,20 @@
+import sqlite3
+
+
+def next_id(conn, name):
+    """Allocate the next id from the named sequence
+
+    Must be called inside a write transaction (BEGIN IMMEDIATE) together
+    with the insert that uses the id. The UPDATE takes the write lock, so
+    two processes can never get the same id, and it is a single primary
+    key lookup instead of a MAX() scan over the whole table.
+    """
+    cursor = conn.execute(
+        "UPDATE sequences SET next_id = next_id + 1 WHERE name = ?", (name,)
+    )
+    if cursor.rowcount != 1:
+        raise sqlite3.OperationalError(f"unknown sequence: {name}")
+
+    return conn.execute(
+        "SELECT next_id - 1 FROM sequences WHERE name = ?", (name,)
+    ).fetchone()[0]
@@ -0,0 +1,439 @@
+import argparse
+import asyncio
+import dataclasses
+import json
+import re
+import secrets
+import signal
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from database import Database
+from passwords import PasswordHasher, ALGORITHMS
+from service import ShopService, ServiceError, NotAllowed, OutOfStock, SearchFilters
+
+# Local HTTP/JSON front end for ShopService.
+#
+#   python3 server.py <database_file> [--port 8080] [--workers 8]
+#
+# POST /login {"uid", "pwd"} returns a token, send it back on every other
+# request as "Authorization: Bearer <token>". Each token is one row in the
+# sessions table. The event loop only parses requests; all SQLite work runs
+# on a bounded thread pool so a slow query never stalls other connections.
+
+MAX_BODY = 1 << 20
+
+STATUS_TEXT = {
+    200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+    404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+    413: "Payload Too Large", 500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def to_json(value):
+    """Dataclasses as dicts, including their computed properties (totals etc.)"""
+    if dataclasses.is_dataclass(value):
+        data = {f.name: to_json(getattr(value, f.name))
+                for f in dataclasses.fields(value) if f.repr}
+        for name, attr in vars(type(value)).items():
+            if isinstance(attr, property):
+                data[name] = to_json(getattr(value, name))
+        return data
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    return value
+
+
+class ShopServer:
+    def __init__(self, service, workers=8, idle_timeout=1800, auth_workers=4):
+        self.service = service
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shop")
+        # Logins and registrations wait on password hashing, give them their
+        # own threads so a burst of logins doesn't hold up everyone else
+        self.auth_pool = ThreadPoolExecutor(max_workers=auth_workers, thread_name_prefix="auth")
+        self.idle_timeout = idle_timeout
+
+        # token -> [Session, last used]; one lock per token so a client's
+        # requests run in order and its pagers aren't shared between threads
+        self.sessions = {}
+        self.locks = {}
+
+        self.requests = 0
+        self.errors = 0
+
+        self.routes = []
+        self.route("POST", r"/login", self.login, auth=False, pool=self.auth_pool)
+        self.route("POST", r"/register", self.register, auth=False, pool=self.auth_pool)
+        self.route("POST", r"/logout", self.logout)
+        self.route("GET", r"/search", self.search)
+        self.route("GET", r"/search/facets", self.search_facets)
+        self.route("GET", r"/search/suggest", self.suggest)
+        self.route("GET", r"/products/([^/]+)", self.view_product)
+        self.route("GET", r"/products/([^/]+)/also-bought", self.also_bought)
+        self.route("GET", r"/cart", self.cart)
+        self.route("POST", r"/cart", self.add_to_cart)
+        self.route("PUT", r"/cart/([^/]+)", self.update_cart_qty)
+        self.route("DELETE", r"/cart/([^/]+)", self.remove_from_cart)
+        self.route("POST", r"/checkout", self.checkout)
+        self.route("GET", r"/orders", self.list_orders)
+        self.route("GET", r"/orders/([^/]+)", self.order_detail)
+        self.route("GET", r"/sales/products/([^/]+)", self.product_info)
+        self.route("PUT", r"/sales/products/([^/]+)", self.update_product)
+        self.route("GET", r"/sales/report", self.sales_report)
+        self.route("GET", r"/sales/top", self.top_products)
+        self.route("GET", r"/stats", self.stats)
+
+    def route(self, method, pattern, handler, auth=True, pool=None):
+        self.routes.append((method, re.compile(pattern + r"/?"), handler, auth,
+                            pool or self.pool))
+
+    # Connection handling (event loop)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+
+                status, payload = await self.dispatch(method, target, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self.write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except HTTPError as e:
+            self.write_response(writer, e.status, {"error": str(e)}, False)
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        """(method, target, headers, body) of the next request, None at end of stream"""
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            raise HTTPError(400, "Bad Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Bad Content-Length")
+        if length > MAX_BODY:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    def write_response(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+
+    async def dispatch(self, method, target, headers, body):
+        self.requests += 1
+        try:
+            url = urlsplit(target)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            try:
+                data = json.loads(body) if body else {}
+            except ValueError:
+                raise HTTPError(400, "Body must be JSON")
+            if not isinstance(data, dict):
+                raise HTTPError(400, "Body must be a JSON object")
+
+            handler, auth, pool, args = self.match(method, url.path)
+
+            if not auth:
+                result = await self.run(pool, handler, None, query, data, *args)
+                if handler == self.login:
+                    result = self.open_session(result)
+                return 200, to_json(result)
+
+            token = headers.get("authorization", "").removeprefix("Bearer ").strip()
+            entry = self.sessions.get(token)
+            lock = self.locks.get(token)
+            if entry is None or lock is None:
+                raise HTTPError(401, "Log in first")
+            entry[1] = time.monotonic()
+
+            async with lock:
+                result = await self.run(pool, handler, entry[0], query, data, *args)
+            if handler == self.logout:
+                self.sessions.pop(token, None)
+                self.locks.pop(token, None)
+            return 200, to_json(result)
+
+        except HTTPError as e:
+            self.errors += 1
+            return e.status, {"error": str(e)}
+        except NotAllowed as e:
+            self.errors += 1
+            return 403, {"error": str(e)}
+        except OutOfStock as e:
+            self.errors += 1
+            return 409, {"error": "Stock issues", "issues": to_json(e.issues)}
+        except ServiceError as e:
+            self.errors += 1
+            return 400, {"error": str(e)}
+        except sqlite3.Error as e:
+            self.errors += 1
+            return 500, {"error": f"Database error: {e}"}
+        except Exception as e:
+            # A bug in one handler must not drop the connection without a reply
+            self.errors += 1
+            print(f"Error handling {method} {target}: {e!r}")
+            return 500, {"error": "Internal error"}
+
+    def match(self, method, path):
+        allowed = False
+        for route_method, pattern, handler, auth, pool in self.routes:
+            found = pattern.fullmatch(path)
+            if found:
+                if route_method == method:
+                    return handler, auth, pool, [unquote(group) for group in found.groups()]
+                allowed = True
+        if allowed:
+            raise HTTPError(405, f"{method} not allowed on {path}")
+        raise HTTPError(404, f"No such resource: {path}")
+
+    async def run(self, pool, func, *args):
+        """Run blocking service code on a thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, func, *args)
+
+    def open_session(self, session):
+        """Hand out a token for a session that just logged in (event loop only)"""
+        token = secrets.token_urlsafe(24)
+        self.sessions[token] = [session, time.monotonic()]
+        self.locks[token] = asyncio.Lock()
+        return {"token": token, "uid": session.uid, "role": session.role,
+                "session_no": session.session_no}
+
+    async def expire_sessions(self):
+        """Log out sessions that have been idle for longer than idle_timeout"""
+        while True:
+            await asyncio.sleep(min(60, self.idle_timeout))
+            cutoff = time.monotonic() - self.idle_timeout
+            for token, (session, last_used) in list(self.sessions.items()):
+                if last_used < cutoff:
+                    self.sessions.pop(token, None)
+                    self.locks.pop(token, None)
+                    try:
+                        await self.run(self.pool, self.service.logout, session)
+                    except sqlite3.Error:
+                        pass
+
+    # Handlers (thread pool), each gets (session, query, body, *path groups)
+
+    def login(self, _, query, body):
+        session = self.service.login(str(body.get("uid", "")), str(body.get("pwd", "")))
+        if session is None:
+            raise HTTPError(401, "Invalid credentials")
+        return session
+
+    def register(self, _, query, body):
+        uid = self.service.register(body.get("name", ""), body.get("email", ""),
+                                    body.get("pwd", ""))
+        return {"uid": uid}
+
+    def logout(self, session, query, body):
+        self.service.logout(session)
+        return {"ok": True}
+
+    def search(self, session, query, body):
+        return self.service.search(session, query.get("q", ""), self.page_param(query),
+                                   filters=self.search_filters(query))
+
+    def search_facets(self, session, query, body):
+        return self.service.search_facets(session, query.get("q", ""),
+                                          self.search_filters(query))
+
+    def suggest(self, session, query, body):
+        return {"suggestions": self.service.suggest(session, query.get("q", ""),
+                                                    self.int_param(query, "limit", 8))}
+
+    def search_filters(self, query):
+        # ?category=&min_price=&max_price=&in_stock=1&sort=name|price_asc|price_desc
+        return SearchFilters(
+            category=query.get("category") or None,
+            min_price=self.number_param(query, "min_price") if query.get("min_price") else None,
+            max_price=self.number_param(query, "max_price") if query.get("max_price") else None,
+            in_stock=query.get("in_stock", "") in ("1", "true", "yes"),
+            sort=query.get("sort") or 'name'
+        )
+
+    def view_product(self, session, query, body, pid):
+        product = self.service.view_product(session, pid)
+        if product is None:
+            raise HTTPError(404, f"Product '{pid}' not found")
+        return product
+
+    def also_bought(self, session, query, body, pid):
+        return self.service.also_bought(session, pid, self.int_param(query, "limit", 5))
+
+    def cart(self, session, query, body):
+        return self.service.cart(session)
+
+    def add_to_cart(self, session, query, body):
+        # {"items": [{"pid": ..., "qty": ...}, ...]} adds many in one go
+        if "items" in body:
+            items = body["items"]
+            if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+                raise HTTPError(400, "items must be a list of {pid, qty}")
+            items = [(item.get("pid"), self.int_param(item, "qty", 1)) for item in items]
+            return {"qty": self.service.add_many_to_cart(session, items)}
+
+        qty = self.int_param(body, "qty", 1)
+        if qty <= 0:
+            raise HTTPError(400, "qty must be positive")
+        return {"qty": self.service.add_to_cart(session, body.get("pid"), qty)}
+
+    def update_cart_qty(self, session, query, body, pid):
+        qty = self.int_param(body, "qty")
+        self.service.update_cart_qty(session, pid, qty)
+        return {"qty": qty}
+
+    def remove_from_cart(self, session, query, body, pid):
+        return {"removed": self.service.remove_from_cart(session, pid)}
+
+    def checkout(self, session, query, body):
+        return self.service.checkout(session, body.get("address", ""))
+
+    def list_orders(self, session, query, body):
+        return self.service.list_orders(session, self.page_param(query))
+
+    def order_detail(self, session, query, body, ono):
+        order = self.service.order_detail(session, ono)
+        if order is None:
+            raise HTTPError(404, f"Order '{ono}' not found")
+        return order
+
+    def product_info(self, session, query, body, pid):
+        product = self.service.product_info(session, pid)
+        if product is None:
+            raise HTTPError(404, f"Product '{pid}' not found")
+        return product
+
+    def update_product(self, session, query, body, pid):
+        if "price" in body:
+            self.service.update_price(session, pid, self.number_param(body, "price"))
+        if "stock" in body:
+            self.service.update_stock(session, pid, self.int_param(body, "stock"))
+        return self.service.product_info(session, pid)
+
+    def sales_report(self, session, query, body):
+        return self.service.sales_report(session, query.get("start"), query.get("end"))
+
+    def top_products(self, session, query, body):
+        return self.service.top_products(session, self.int_param(query, "limit", 3))
+
+    def stats(self, session, query, body):
+        # Query stats include SQL parameters such as customers' search text
+        self.service.require_sales(session)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "sessions": len(self.sessions),
+            "activity": self.service.activity.stats(),
+            "product_cache": self.service.products.stats(),
+            "search_cache": self.service.search_cache.stats(),
+            "autocomplete": self.service.completer.stats(),
+            "spelling": self.service.spelling.stats(),
+            "cart_sweeper": self.service.sweeper.stats(),
+            "queries": to_json(self.service.db.query_stats.top(10)),
+            "slow_queries": to_json(self.service.db.query_stats.slow_queries()[-10:]),
+        }
+
+    def int_param(self, params, name, default=0):
+        try:
+            return int(params.get(name, default))
+        except (TypeError, ValueError):
+            raise HTTPError(400, f"{name} must be a whole number")
+
+    def page_param(self, params):
+        page = self.int_param(params, "page")
+        if page < 0:
+            raise HTTPError(400, "page can't be negative")
+        return page
+
+    def number_param(self, params, name):
+        try:
+            return float(params[name])
+        except (TypeError, ValueError):
+            raise HTTPError(400, f"{name} must be a number")
+
+    async def serve(self, host, port):
+        """Serve until SIGINT/SIGTERM"""
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        expiry = asyncio.create_task(self.expire_sessions())
+        print(f"Serving on http://{host}:{port}")
+        async with server:
+            await stop.wait()
+        expiry.cancel()
+        print("\nShutting down.")
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.auth_pool.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON server for the shop")
+    parser.add_argument("db_name")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=8,
+                        help="threads doing SQLite work")
+    parser.add_argument("--idle-timeout", type=int, default=1800,
+                        help="seconds before an unused session is logged out")
+    parser.add_argument("--kdf", choices=ALGORITHMS, default="scrypt",
+                        help="password hashing algorithm")
+    parser.add_argument("--kdf-cost", type=int,
+                        help="log2(n) for scrypt or iterations for PBKDF2")
+    args = parser.parse_args()
+
+    # One reader connection per worker so queries never wait for a connection
+    db = Database(args.db_name, readers=args.workers)
+    service = ShopService(db, passwords=PasswordHasher(args.kdf, args.kdf_cost))
+    server = ShopServer(service, args.workers, args.idle_timeout)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    finally:
+        server.close()
+        service.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
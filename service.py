@@ -0,0 +1,895 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from activity_log import ActivityLogger
+from autocomplete import Autocomplete
+from cart_sweeper import CartSweeper
+from paging import KeysetPager
+from passwords import PasswordHasher
+from product_cache import ProductCache, PRODUCT_COLUMNS
+from search_cache import SearchCache, TOO_BIG, normalize_query
+from search_index import ProductSearchIndex
+from spelling import SpellingIndex
+from sequences import next_id
+import catalog_io
+import rollups
+import leaderboards
+import recommendations
+
+# A session never logged out this long after it started counts as left
+# behind (a killed CLI, say), so the next login may take its cart
+SESSION_TIMEOUT = timedelta(days=1)
+
+
+class ServiceError(Exception):
+    """A request the service refuses, the message is meant for the user"""
+
+
+class NotAllowed(ServiceError):
+    """The session's role may not do this"""
+
+
+class OutOfStock(ServiceError):
+    """Checkout failed because some cart lines have more than is in stock"""
+
+    def __init__(self, issues):
+        super().__init__("Stock issues: " + ", ".join(issue.name for issue in issues))
+        self.issues = issues
+
+
+@dataclass
+class Session:
+    """Who is logged in, resolved once at login and reused by every call
+
+    cid is None for users without a customers row (sales), and so is
+    session_no since the sessions table only holds customer sessions.
+    """
+    uid: str
+    role: str
+    cid: str = None
+    session_no: int = None
+    # Open pagers by kind ('search', 'orders'), so moving one page is one seek
+    pagers: dict = field(default_factory=dict, repr=False)
+
+    @property
+    def key(self):
+        """(cid, sessionNo), the key of this session's cart rows"""
+        return (self.cid, self.session_no)
+
+
+@dataclass
+class Product:
+    pid: str
+    name: str
+    category: str
+    price: float
+    stock_count: int
+    descr: str
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row['pid'], row['name'], row['category'], row['price'],
+                   row['stock_count'], row['descr'])
+
+
+# Search sort orders: keyset pager keys and whether they run descending
+SEARCH_SORTS = {
+    'name': ([("name", "name"), ("pid", "pid")], False),
+    'price_asc': ([("price", "price"), ("pid", "pid")], False),
+    'price_desc': ([("price", "price"), ("pid", "pid")], True),
+}
+
+
+@dataclass(frozen=True)
+class SearchFilters:
+    category: str = None
+    min_price: float = None
+    max_price: float = None
+    in_stock: bool = False
+    sort: str = 'name'
+
+    @property
+    def active(self):
+        return self != SearchFilters()
+
+    def clause(self, with_category=True):
+        """SQL conditions on products for these filters, returns (sql, params)"""
+        conditions = []
+        params = []
+        if self.category is not None and with_category:
+            conditions.append("category = ?")
+            params.append(self.category)
+        if self.min_price is not None:
+            conditions.append("price >= ?")
+            params.append(self.min_price)
+        if self.max_price is not None:
+            conditions.append("price <= ?")
+            params.append(self.max_price)
+        if self.in_stock:
+            conditions.append("stock_count > 0")
+        return " AND ".join(conditions) or "1", params
+
+
+@dataclass
+class CategoryCount:
+    category: str
+    count: int
+
+
+@dataclass
+class Page:
+    items: list
+    page: int
+    page_size: int
+    total: int
+    has_next: bool
+    # Search only: the keywords used instead when the query matched nothing
+    corrected: str = None
+
+    @property
+    def total_pages(self):
+        return max(1, (self.total + self.page_size - 1) // self.page_size)
+
+
+@dataclass
+class Recommendation:
+    pid: str
+    name: str
+    price: float
+    orders: int
+
+
+@dataclass
+class CartItem:
+    pid: str
+    name: str
+    price: float
+    qty: int
+    stock_count: int
+
+    @property
+    def total(self):
+        return self.price * self.qty
+
+
+@dataclass
+class Cart:
+    items: list
+
+    @property
+    def total(self):
+        return sum(item.total for item in self.items)
+
+    def stock_issues(self):
+        return [StockIssue(item.pid, item.name, item.qty, item.stock_count)
+                for item in self.items if item.qty > item.stock_count]
+
+
+@dataclass
+class StockIssue:
+    pid: str
+    name: str
+    qty: int
+    stock_count: int
+
+
+@dataclass
+class Receipt:
+    ono: str
+    total: float
+    address: str
+
+
+@dataclass
+class OrderSummary:
+    ono: str
+    odate: str
+    shipping_address: str
+    total: float
+
+
+@dataclass
+class OrderLine:
+    name: str
+    category: str
+    qty: int
+    uprice: float
+
+    @property
+    def total(self):
+        return self.qty * self.uprice
+
+
+@dataclass
+class OrderDetail:
+    ono: str
+    odate: str
+    shipping_address: str
+    lines: list
+
+    @property
+    def total(self):
+        return sum(line.total for line in self.lines)
+
+
+@dataclass
+class SalesReport:
+    start: str
+    end: str
+    orders: int
+    products: int
+    customers: int
+    revenue: float
+
+    @property
+    def avg_per_customer(self):
+        return self.revenue / self.customers if self.customers > 0 else 0
+
+
+@dataclass
+class RankedProduct:
+    pid: str
+    name: str
+    category: str
+    count: int
+
+
+@dataclass
+class TopProducts:
+    by_orders: list
+    by_views: list
+
+
+@dataclass
+class QueryReport:
+    statements: list
+    slow_queries: list
+    slow_ms: float
+    product_cache: dict
+    search_cache: dict
+    autocomplete: dict
+    activity: dict
+
+
+class ShopService:
+    """The customer and sales workflows without any terminal I/O
+
+    Every method takes the caller's Session (from login()) and returns
+    plain data classes. Requests that can't be done raise ServiceError
+    with a message for the user, database problems raise sqlite3.Error.
+    One service can be shared by many sessions.
+    """
+
+    def __init__(self, db, activity=None, products=None, passwords=None, sweeper=None):
+        self.db = db
+        self.owns_activity = activity is None
+        self.activity = activity or ActivityLogger(db)
+        self.products = products or ProductCache(db)
+        self.passwords = passwords or PasswordHasher()
+        self.owns_sweeper = sweeper is None
+        self.sweeper = sweeper or CartSweeper(db)
+        self.search_cache = SearchCache()
+        self.completer = Autocomplete(db)
+        self.spelling = SpellingIndex(db)
+
+        self.search_index = ProductSearchIndex(self.db)
+        # Build the spelling index in the background before the first typo
+        self.spelling.refresh()
+
+    def close(self):
+        """Stop the background threads this service started"""
+        if self.owns_activity:
+            self.activity.close()
+        if self.owns_sweeper:
+            self.sweeper.close()
+        self.spelling.close()
+
+    # Accounts and sessions
+
+    def login(self, uid, pwd):
+        """Check the credentials and start a session, returns None if they are wrong"""
+        # Parameterized query prevents SQL injection. customers.cid is the
+        # user's uid, so the join tells us the customer id in the same query
+        user = self.db.query_one(
+            """SELECT u.uid, u.role, u.pwd, c.cid
+            FROM users u
+            LEFT JOIN customers c ON c.cid = u.uid
+            WHERE u.uid = ?""",
+            (uid,)
+        )
+        # An unknown uid still costs one hash, like a wrong password
+        if not self.passwords.verify(pwd, user['pwd'] if user else None) or not user:
+            return None
+
+        # Plaintext from before hashing, or an old cost setting
+        if self.passwords.needs_rehash(user['pwd']):
+            new_hash = self.passwords.hash(pwd)
+            with self.db.transaction() as conn:
+                conn.execute(
+                    "UPDATE users SET pwd = ? WHERE uid = ? AND pwd = ?",
+                    (new_hash, user['uid'], user['pwd'])
+                )
+
+        return self.start_session(user['uid'], user['role'], user['cid'])
+
+    def register(self, name, email, pwd):
+        """Create a customer account, returns the new uid"""
+        # Hash before taking the write lock, it is the slow part
+        pwd_hash = self.passwords.hash(pwd)
+
+        # The write transaction starts with BEGIN IMMEDIATE, so the email
+        # check and the new ids stay valid until we commit
+        with self.db.transaction() as conn:
+            # Check if email exists
+            if conn.execute(
+                "SELECT email FROM customers WHERE email = ?", (email,)
+            ).fetchone():
+                conn.rollback()
+                raise ServiceError("Email already registered.")
+
+            # Generate unique uid, the customer row uses the same id
+            # since customers.cid references users
+            new_uid = str(next_id(conn, 'users'))
+
+            conn.execute(
+                "INSERT INTO users (uid, pwd, role) VALUES (?, ?, 'customer')",
+                (new_uid, pwd_hash)
+            )
+            conn.execute(
+                "INSERT INTO customers (cid, name, email) VALUES (?, ?, ?)",
+                (new_uid, name, email)
+            )
+        return new_uid
+
+    def start_session(self, uid, role, cid):
+        """Open a sessions row for a customer, returns the Session
+
+        The customer's cart comes along: rows from earlier sessions that
+        were logged out (or are older than SESSION_TIMEOUT) are moved to
+        the new one with a single UPDATE on the cart's primary key, so
+        logging in again shows the same cart. Sessions still open, like a
+        second terminal or HTTP token, keep their own cart. A pid that is
+        already in the new session's cart stays where it was and is left
+        for the CartSweeper.
+        """
+        session = Session(uid, role, cid)
+        if cid is None:
+            return session
+
+        now = datetime.now()
+        with self.db.transaction() as conn:
+            # sessionNo is a weak key dependent on cid
+            # so we add the next sessionNo of that customer
+            session.session_no = conn.execute(
+                """INSERT INTO sessions (cid, sessionNo, start_time)
+                SELECT ?, COALESCE(MAX(sessionNo), 0) + 1, ? FROM sessions WHERE cid = ?
+                RETURNING sessionNo""",
+                (cid, now.isoformat(), cid)
+            ).fetchone()[0]
+
+            conn.execute(
+                """UPDATE OR IGNORE cart SET sessionNo = ?
+                WHERE cid = ? AND sessionNo IN (
+                    SELECT sessionNo FROM sessions
+                    WHERE cid = ? AND sessionNo < ?
+                      AND (end_time IS NOT NULL OR start_time < ?)
+                )""",
+                (session.session_no, cid, cid, session.session_no,
+                 (now - SESSION_TIMEOUT).isoformat())
+            )
+        return session
+
+    def logout(self, session):
+        """Write out the session's buffered activity and close the session"""
+        self.activity.flush()
+        session.pagers.clear()
+        if session.cid is None:
+            return
+
+        with self.db.transaction() as conn:
+            conn.execute(
+                "UPDATE sessions SET end_time = ? WHERE cid = ? AND sessionNo = ?",
+                (datetime.now().isoformat(), *session.key)
+            )
+
+    # Browsing
+
+    def search(self, session, query, page=0, page_size=5, filters=None):
+        """One page of products matching every keyword in query and the filters
+
+        Page 0 starts a new search and logs it. For a plain keyword search
+        the matching pids usually come from the search cache and a page is
+        a slice of them. Filtered or re-sorted searches, and ones with too
+        many matches to cache, continue from the session's last pager for
+        the same search, so paging forward or back is one indexed seek
+        instead of skipping over earlier pages.
+
+        If nothing matches, misspelled keywords are replaced by the closest
+        product words and the search is run once more (Page.corrected).
+        """
+        query = query.strip()
+        filters = filters or SearchFilters()
+        page = max(0, page)
+        self.check_filters(filters)
+        if not query and not filters.active:
+            raise ServiceError("Please enter a search term.")
+
+        # Record search with original query, written in the background
+        if page == 0 and query and session.cid is not None:
+            self.activity.log_search(session.cid, session.session_no, query)
+
+        keywords = normalize_query(query)
+        result = self.find_page(session, keywords, page, page_size, filters)
+        if result.total == 0 and keywords:
+            corrected = " ".join(self.spelling.correct(query.lower().split()))
+            if normalize_query(corrected) != keywords:
+                result = self.find_page(session, normalize_query(corrected),
+                                        page, page_size, filters)
+                result.corrected = corrected
+        return result
+
+    def find_page(self, session, keywords, page, page_size, filters):
+        pids = self.cached_search(keywords) if not filters.active else None
+        if pids is not None:
+            # Page through the cached pid list, the rows come from the product cache
+            last_page = max(0, (len(pids) - 1) // page_size)
+            page = min(max(0, page), last_page)
+            page_pids = pids[page * page_size:(page + 1) * page_size]
+            rows = self.products.get_many(page_pids)
+            items = [Product.from_row(rows[str(pid)]) for pid in page_pids if str(pid) in rows]
+            return Page(items, page, page_size, len(pids), page < last_page)
+
+        # Page from the database
+        pager_key = (keywords, filters, page_size)
+        pager = self.open_pager(session, 'search', pager_key, page)
+        if pager is None:
+            where_clause, params = self.search_where(keywords, filters)
+            keys, descending = SEARCH_SORTS[filters.sort]
+            pager = KeysetPager(
+                self.db,
+                f"SELECT {PRODUCT_COLUMNS} FROM products",
+                where_clause, params,
+                keys=keys,
+                descending=descending,
+                page_size=page_size
+            )
+            session.pagers['search'] = (pager_key, pager)
+
+        return self.turn_to(pager, page, Product.from_row)
+
+    def suggest(self, session, text, limit=8):
+        """Completions for a partly typed search, from product words and past searches"""
+        return self.completer.suggest(text, limit)
+
+    def search_facets(self, session, query, filters=None):
+        """Matching products per category, most first, in one grouped query
+
+        The category filter itself is left out, so the counts show what
+        picking another category would give.
+        """
+        filters = filters or SearchFilters()
+        self.check_filters(filters)
+        where_clause, params = self.search_where(normalize_query(query), filters,
+                                                 with_category=False)
+        rows = self.db.query(
+            f"""SELECT category, COUNT(*) AS count FROM products
+            WHERE {where_clause}
+            GROUP BY category
+            ORDER BY count DESC, category""",
+            params
+        )
+        return [CategoryCount(row['category'], row['count']) for row in rows]
+
+    def search_where(self, keywords, filters, with_category=True):
+        # Each keyword must appear in at least one field (name, descr, or category)
+        match_clause, params = self.search_index.match_clause(keywords)
+        filter_clause, filter_params = filters.clause(with_category)
+        return f"({match_clause}) AND ({filter_clause})", params + filter_params
+
+    def check_filters(self, filters):
+        if filters.sort not in SEARCH_SORTS:
+            raise ServiceError(f"Sort must be one of {', '.join(SEARCH_SORTS)}.")
+        if (filters.min_price is not None and filters.max_price is not None
+                and filters.min_price > filters.max_price):
+            raise ServiceError("Minimum price is above the maximum price.")
+
+    def cached_search(self, keywords):
+        """Every pid matching keywords in name order, from the search cache if possible
+
+        Returns None when there are more matches than the cache keeps.
+        """
+        with self.db.reader() as conn:
+            version = conn.execute("SELECT version FROM catalog_version").fetchone()[0]
+            pids = self.search_cache.get(keywords, version)
+            if pids is not None:
+                return pids if pids is not TOO_BIG else None
+
+            where_clause, params = self.search_index.match_clause(keywords)
+            rows = conn.execute(
+                f"""SELECT pid FROM products WHERE {where_clause}
+                ORDER BY name, pid LIMIT ?""",
+                (*params, self.search_cache.max_pids + 1)
+            ).fetchall()
+
+        pids = [row['pid'] for row in rows]
+        self.search_cache.put(keywords, version, pids)
+        return pids if len(pids) <= self.search_cache.max_pids else None
+
+    def view_product(self, session, pid):
+        """Current details of a product, recorded as a view; None if there is no such product"""
+        row = self.products.get(pid)
+        if not row:
+            return None
+
+        # Record view, written in the background
+        if session.cid is not None:
+            self.activity.log_view(session.cid, session.session_no, row['pid'])
+        return Product.from_row(row)
+
+    def also_bought(self, session, pid, limit=5):
+        """Products most often ordered together with pid, from the precomputed table"""
+        with self.db.reader() as conn:
+            rows = recommendations.also_bought(conn, pid, limit)
+        return [Recommendation(row['pid'], row['name'], row['price'], row['score'])
+                for row in rows]
+
+    # Cart
+
+    def add_to_cart(self, session, pid, qty=1):
+        """Add qty of pid to the cart, returns the quantity now in the cart"""
+        # Keyed by the stored pid, which may be spelled differently from pid
+        added = self.add_many_to_cart(session, [(pid, qty)])
+        return next(iter(added.values()))
+
+    def add_many_to_cart(self, session, items):
+        """Add a list of (pid, qty) to the cart in one transaction
+
+        Returns {pid: quantity now in the cart}. If any pid doesn't exist
+        nothing is added.
+        """
+        self.require_customer(session)
+        if any(qty <= 0 for _, qty in items):
+            raise ServiceError("Quantity must be positive.")
+
+        added = {}
+        with self.db.transaction() as conn:
+            for pid, qty in items:
+                # One upsert per line; selecting from products skips unknown
+                # pids instead of failing on the foreign key
+                row = conn.execute(
+                    """INSERT INTO cart (cid, sessionNo, pid, qty)
+                    SELECT ?, ?, pid, ? FROM products WHERE pid = ?
+                    ON CONFLICT (cid, sessionNo, pid) DO UPDATE SET qty = qty + excluded.qty
+                    RETURNING pid, qty""",
+                    (*session.key, qty, pid)
+                ).fetchone()
+                if row is None:
+                    conn.rollback()
+                    raise ServiceError(f"Product '{pid}' not found.")
+                added[str(row['pid'])] = row['qty']
+        return added
+
+    def cart(self, session):
+        """Cart lines with product name, price and stock from the product cache"""
+        self.require_customer(session)
+        cart = self.db.query(
+            "SELECT pid, qty FROM cart WHERE cid = ? AND sessionNo = ?", session.key
+        )
+        products = self.products.get_many([line['pid'] for line in cart])
+
+        items = []
+        for line in cart:
+            product = products.get(str(line['pid']))
+            if not product:
+                continue
+            items.append(CartItem(line['pid'], product['name'], product['price'],
+                                  line['qty'], product['stock_count']))
+
+        items.sort(key=lambda item: item.name)
+        return Cart(items)
+
+    def update_cart_qty(self, session, pid, qty):
+        self.require_customer(session)
+        if qty <= 0:
+            raise ServiceError("Quantity must be positive.")
+
+        # The stock check is part of the UPDATE, so it sees the current stock
+        with self.db.transaction() as conn:
+            updated = conn.execute(
+                """UPDATE cart SET qty = ?
+                WHERE cid = ? AND sessionNo = ? AND pid = ?
+                AND ? <= (SELECT stock_count FROM products WHERE pid = cart.pid)""",
+                (qty, *session.key, pid, qty)
+            ).rowcount
+        if updated:
+            return
+
+        # Nothing updated, work out why
+        product = self.products.get(pid)
+        if not product:
+            raise ServiceError("Product not found.")
+        if qty > product['stock_count']:
+            raise ServiceError(f"Insufficient stock for {product['name']}.\n"
+                               f"Available: {product['stock_count']} units")
+        raise ServiceError("Product not in cart.")
+
+    def remove_from_cart(self, session, pid):
+        """Remove pid from the cart, returns the product name"""
+        self.require_customer(session)
+
+        with self.db.transaction() as conn:
+            item = conn.execute(
+                """DELETE FROM cart WHERE cid = ? AND sessionNo = ? AND pid = ?
+                RETURNING (SELECT name FROM products WHERE pid = cart.pid) AS name""",
+                (*session.key, pid)
+            ).fetchone()
+
+        if not item:
+            raise ServiceError("Product not in cart.")
+        return item['name']
+
+    # Orders
+
+    def checkout(self, session, address):
+        """Place an order for the whole cart
+
+        Raises OutOfStock with the lines that lacked stock, in which case
+        nothing is changed.
+        """
+        self.require_customer(session)
+        address = address.strip()
+        if not address:
+            raise ServiceError("Shipping address is required.")
+
+        ono, total, failed = self.place_order(session.cid, session.session_no, address)
+
+        # Stock changed since the cart was shown, e.g. another customer bought it
+        if failed:
+            raise OutOfStock([StockIssue(line['pid'], line['name'], line['qty'],
+                                         line['stock_count']) for line in failed])
+        if ono is None:
+            raise ServiceError("Your cart is empty. Add items before checkout.")
+
+        # The order list has a new first entry
+        session.pagers.pop('orders', None)
+        return Receipt(ono, total, address)
+
+    def place_order(self, cid, session_no, address):
+        """Turn the session's cart into an order in a single write transaction
+
+        Stock for every line is reserved with one guarded UPDATE, then the
+        order lines are copied from the cart with INSERT ... SELECT and the
+        cart is cleared. Returns (ono, total, []) on success, or
+        (None, 0, failed) with the cart lines that lacked stock, in which
+        case nothing is changed.
+        """
+        key = (cid, session_no)
+
+        # BEGIN IMMEDIATE locks out other writers from the reservation until we commit
+        with self.db.transaction() as conn:
+            # Reserve stock only where there is enough of it
+            reserved = conn.execute(
+                """UPDATE products
+                SET stock_count = products.stock_count - c.qty
+                FROM cart c
+                WHERE c.cid = ? AND c.sessionNo = ? AND c.pid = products.pid
+                  AND products.stock_count >= c.qty
+                RETURNING products.pid""",
+                key
+            ).fetchall()
+            reserved_pids = {row['pid'] for row in reserved}
+
+            lines = conn.execute(
+                """SELECT c.pid, p.name, c.qty, p.stock_count
+                FROM cart c
+                JOIN products p ON c.pid = p.pid
+                WHERE c.cid = ? AND c.sessionNo = ?
+                ORDER BY p.name""",
+                key
+            ).fetchall()
+
+            # Lines that were not reserved still show their unchanged stock
+            failed = [line for line in lines if line['pid'] not in reserved_pids]
+            if failed or not lines:
+                conn.rollback()
+                return None, 0, failed
+
+            ono = str(next_id(conn, 'orders'))
+
+            # Create order
+            conn.execute(
+                """INSERT INTO orders (ono, cid, sessionNo, odate, shipping_address)
+                VALUES (?, ?, ?, ?, ?)""",
+                (ono, cid, session_no, datetime.now().date().isoformat(), address)
+            )
+
+            # Create all order lines at once, numbered in the same order as the summary
+            conn.execute(
+                """INSERT INTO orderlines (ono, lineNo, pid, qty, uprice)
+                SELECT ?, ROW_NUMBER() OVER (ORDER BY p.name, c.pid), c.pid, c.qty, p.price
+                FROM cart c
+                JOIN products p ON c.pid = p.pid
+                WHERE c.cid = ? AND c.sessionNo = ?""",
+                (ono, *key)
+            )
+
+            total = conn.execute(
+                "SELECT SUM(qty * uprice) FROM orderlines WHERE ono = ?", (ono,)
+            ).fetchone()[0]
+
+            # Clear cart
+            conn.execute(
+                "DELETE FROM cart WHERE cid = ? AND sessionNo = ?", key
+            )
+
+            # Keep the sales report rollups and leaderboards current
+            rollups.record_order(conn, ono)
+            leaderboards.record_order(conn, ono)
+
+        # Stock went down for every line
+        self.products.invalidate(*reserved_pids)
+        return ono, total, []
+
+    def list_orders(self, session, page=0, page_size=5):
+        """One page of the customer's orders, newest first"""
+        self.require_customer(session)
+        cid = session.cid
+        page = max(0, page)
+
+        pager = self.open_pager(session, 'orders', (cid, page_size), page)
+        if pager is None:
+            pager = KeysetPager(
+                self.db,
+                """SELECT o.ono, o.odate, o.shipping_address,
+                        SUM(ol.qty * ol.uprice) as total
+                FROM orders o
+                JOIN orderlines ol ON o.ono = ol.ono""",
+                "o.cid = ?", (cid,),
+                keys=[("o.odate", "odate"), ("o.ono", "ono")],
+                group_by="GROUP BY o.ono",
+                descending=True,
+                page_size=page_size
+            )
+            session.pagers['orders'] = ((cid, page_size), pager)
+
+        return self.turn_to(pager, page, lambda row: OrderSummary(
+            row['ono'], row['odate'], row['shipping_address'], row['total']))
+
+    def order_detail(self, session, ono):
+        """An order of the session's customer with its lines, None if there is no such order"""
+        order = self.db.query_one(
+            "SELECT ono, odate, shipping_address FROM orders WHERE ono = ? AND cid = ?",
+            (ono, session.cid)
+        )
+        if not order:
+            return None
+
+        lines = self.db.query(
+            """SELECT p.name, p.category, ol.qty, ol.uprice
+            FROM orderlines ol
+            JOIN products p ON ol.pid = p.pid
+            WHERE ol.ono = ?
+            ORDER BY ol.lineNo""",
+            (order['ono'],)
+        )
+        return OrderDetail(order['ono'], order['odate'], order['shipping_address'],
+                           [OrderLine(line['name'], line['category'], line['qty'],
+                                      line['uprice']) for line in lines])
+
+    # Sales
+
+    def product_info(self, session, pid):
+        """Product details for the sales role, None if there is no such product"""
+        self.require_sales(session)
+        row = self.products.get(pid)
+        return Product.from_row(row) if row else None
+
+    def update_price(self, session, pid, price):
+        self.require_sales(session)
+        if price <= 0:
+            raise ServiceError("Price must be positive.")
+        self.update_product(pid, "price", price)
+
+    def update_stock(self, session, pid, stock):
+        self.require_sales(session)
+        if stock < 0:
+            raise ServiceError("Stock must be non-negative.")
+        self.update_product(pid, "stock_count", stock)
+
+    def update_product(self, pid, column, value):
+        with self.db.transaction() as conn:
+            updated = conn.execute(
+                f"UPDATE products SET {column} = ? WHERE pid = ?", (value, pid)
+            ).rowcount
+        self.products.invalidate(pid)
+        if updated == 0:
+            raise ServiceError(f"Product '{pid}' not found.")
+
+    def import_products(self, session, path, fmt=None, batch_size=5000, progress=None):
+        """Upsert products from a CSV/JSON lines file, returns an ImportResult"""
+        self.require_sales(session)
+        try:
+            return catalog_io.import_products(self.db, path, fmt, batch_size,
+                                              self.products, progress)
+        except (OSError, ValueError) as e:
+            raise ServiceError(f"Import failed: {e}")
+
+    def export_products(self, session, path, fmt=None, progress=None):
+        """Write all products to a CSV/JSON lines file, returns an ExportResult"""
+        self.require_sales(session)
+        try:
+            return catalog_io.export_products(self.db, path, fmt, progress=progress)
+        except (OSError, ValueError) as e:
+            raise ServiceError(f"Export failed: {e}")
+
+    def sales_report(self, session, start=None, end=None):
+        """Sales between start and end (inclusive), by default the last 7 days"""
+        self.require_sales(session)
+        start = start or (datetime.now() - timedelta(days=7)).date().isoformat()
+        end = end or datetime.now().date().isoformat()
+
+        # Orders, revenue and distinct products/customers come from the
+        # daily rollups, one row per day instead of every order line
+        with self.db.reader() as conn:
+            summary = rollups.sales_summary(conn, start, end)
+
+        return SalesReport(start, end, summary['orders'], summary['products'],
+                           summary['customers'], summary['revenue'])
+
+    def top_products(self, session, limit=3):
+        """Top products by distinct orders and by views, ties included"""
+        self.require_sales(session)
+
+        # Ranked from the per-product counters kept up to date at checkout
+        # and as views are logged
+        with self.db.reader() as conn:
+            by_orders = leaderboards.top_by_orders(conn, limit)
+            by_views = leaderboards.top_by_views(conn, limit)
+
+        return TopProducts(
+            [RankedProduct(p['pid'], p['name'], p['category'], p['order_count'])
+             for p in by_orders],
+            [RankedProduct(p['pid'], p['name'], p['category'], p['view_count'])
+             for p in by_views]
+        )
+
+    def query_report(self, session, limit=10):
+        """The statements taking the most total time, recent slow queries and cache stats"""
+        self.require_sales(session)
+        stats = self.db.query_stats
+        return QueryReport(stats.top(limit), stats.slow_queries()[-limit:], stats.slow_ms,
+                           self.products.stats(), self.search_cache.stats(),
+                           self.completer.stats(), self.activity.stats())
+
+    def require_customer(self, session):
+        if session.cid is None:
+            raise NotAllowed("Only customers have a cart and orders.")
+
+    def require_sales(self, session):
+        if session.role != 'sales':
+            raise NotAllowed("Only sales users can do that.")
+
+    # Paging helpers
+
+    def open_pager(self, session, kind, key, page):
+        """The session's pager of this kind if it is for the same key, None otherwise
+
+        Page 0 always gets a fresh pager so new results show up.
+        """
+        if page == 0 or kind not in session.pagers:
+            return None
+        pager_key, pager = session.pagers[kind]
+        return pager if pager_key == key else None
+
+    def turn_to(self, pager, page, make_item):
+        """Move pager to page (stopping at the first or last one) and wrap its rows"""
+        page = max(0, page)
+        if pager.page_no == 0 and not pager.rows:
+            pager.load()
+        while pager.page_no < page and pager.has_next:
+            pager.next()
+        while pager.page_no > page:
+            pager.prev()
+
+        return Page([make_item(row) for row in pager.rows], pager.page_no,
+                    pager.page_size, pager.count(), pager.has_next)
@@ -3,6 +3,10 @@ from pathlib import Path
 import sqlite3
 import os
 
+# migrations.py lives next to main.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from migrations import migrate
+
 # Ensure db_path is specified
 if len(sys.argv) < 2:
     print(f"Usage: {sys.argv[0]} <db_path> [schema_file]")
@@ -27,6 +31,8 @@ print("\nCreating database...")
 with open(schema_file, "r", encoding="utf-8") as f:
     conn.executescript(f.read())
 
+# Tables were just recreated, so every migration has to run again
+conn.execute("PRAGMA user_version = 0")
 conn.commit()
 
 print(f"Database '{db_path}' created successfully from '{schema_file}'.")
@@ -125,6 +131,10 @@ for p in products:
     cursor.execute('INSERT INTO products VALUES (?, ?, ?, ?, ?, ?)', p)
 
 conn.commit()
+
+# Indexes and ANALYZE, after the data is loaded
+version = migrate(conn)
+print(f"Schema migrated to version {version}.")
 conn.close()
 
 print(f"✓ Database created: {db_path}")
@@ -0,0 +1,252 @@
+import argparse
+import bisect
+import itertools
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# migrations.py lives next to main.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from migrations import migrate
+
+# Vocabulary for product names, descriptions and search queries
+CATALOG = {
+    'Electronics': (['Laptop', 'Monitor', 'Webcam', 'Tablet', 'Smartphone', 'Router'],
+                    ['13-inch', '14-inch', '15-inch', '27-inch', '4K', 'OLED', 'Touchscreen', 'Gaming']),
+    'Computer Components': (['SODIMM', 'DIMM', 'SSD', 'GPU', 'CPU', 'Motherboard', 'Power Supply'],
+                            ['8GB', '16GB', '32GB', '64GB', 'DDR4', 'DDR5', 'NVMe', '1TB', '2TB', 'RTX']),
+    'Accessories': (['USB-C Cable', 'Cooling Pad', 'Laptop Bag', 'Docking Station', 'Charger', 'Hub'],
+                    ['Fast', 'Braided', 'Compact', 'Portable', '100W', 'Thunderbolt']),
+    'Audio': (['Headphones', 'Earbuds', 'Speaker', 'Microphone', 'Soundbar'],
+              ['Wireless', 'Noise-Cancelling', 'Bluetooth', 'Studio', 'Bass']),
+    'Peripherals': (['Mouse', 'Keyboard', 'Mechanical Keyboard', 'Trackpad', 'Drawing Tablet'],
+                    ['Wireless', 'Ergonomic', 'RGB', 'Silent', 'Compact']),
+    'Furniture': (['Desk Lamp', 'Gaming Chair', 'Standing Desk', 'Monitor Arm', 'Footrest'],
+                  ['LED', 'Adjustable', 'Ergonomic', 'Oak', 'Steel']),
+}
+BRANDS = ['Acme', 'Nova', 'Vertex', 'Orion', 'Zenith', 'Pulse', 'Apex', 'Lumen', 'Kestrel', 'Atlas']
+USES = ['gaming', 'office work', 'students', 'creators', 'travel', 'professionals', 'home use']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Generate a large synthetic database for performance testing"
+    )
+    parser.add_argument("db_path")
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--searches", type=int, default=300000)
+    parser.add_argument("--views", type=int, default=1000000)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--lines-per-order", type=int, default=8,
+                        help="maximum lines per order (the average is lower)")
+    parser.add_argument("--days", type=int, default=90,
+                        help="spread activity over this many days up to today")
+    parser.add_argument("--skew", type=float, default=1.1,
+                        help="Zipf exponent for product and customer popularity")
+    parser.add_argument("--seed", type=int, default=291)
+    parser.add_argument("--batch", type=int, default=50000,
+                        help="rows per executemany call")
+    parser.add_argument("--schema", default=str(Path(__file__).with_name("prj-tables.sql")))
+    return parser.parse_args()
+
+
+def zipf_picker(rng, n, skew):
+    """Return a function picking an index in [0, n) with Zipf-distributed popularity"""
+    cum_weights = list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, n + 1)))
+    total = cum_weights[-1]
+    # Shuffle which ids are popular so they aren't all the lowest ids
+    order = list(range(n))
+    rng.shuffle(order)
+
+    def pick():
+        return order[bisect.bisect_left(cum_weights, rng.random() * total)]
+    return pick
+
+
+def insert_batches(conn, sql, rows, batch_size):
+    """executemany in chunks so the generators never build a huge list"""
+    count = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return count
+        conn.executemany(sql, batch)
+        count += len(batch)
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+
+    conn = sqlite3.connect(args.db_path)
+    conn.row_factory = sqlite3.Row
+
+    print(f"\nCreating schema in '{args.db_path}'...")
+    with open(args.schema, "r", encoding="utf-8") as f:
+        conn.executescript(f.read())
+    conn.execute("PRAGMA user_version = 0")
+
+    # Bulk load settings: nothing here needs to survive a crash mid-load
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -200000")
+
+    now = datetime.now().replace(microsecond=0)
+    first_day = now - timedelta(days=args.days)
+    counts = {}
+
+    conn.execute("BEGIN")
+
+    # Users and customers: uid 1 is the usual test customer, the sales
+    # account comes right after the last customer
+    sales_uid = args.customers + 1
+
+    def users():
+        for uid in range(1, args.customers + 1):
+            yield (uid, 'customer123' if uid == 1 else f'pw{uid}', 'customer')
+        yield (sales_uid, 'sales456', 'sales')
+
+    counts['users'] = insert_batches(
+        conn, "INSERT INTO users VALUES (?, ?, ?)", users(), args.batch)
+    counts['customers'] = insert_batches(
+        conn, "INSERT INTO customers VALUES (?, ?, ?)",
+        ((cid, f"Customer {cid}", f"customer{cid}@example.com")
+         for cid in range(1, args.customers + 1)),
+        args.batch)
+
+    # Products
+    categories = list(CATALOG)
+    prices = []
+
+    def products():
+        for pid in range(1, args.products + 1):
+            category = rng.choice(categories)
+            nouns, specs = CATALOG[category]
+            noun = rng.choice(nouns)
+            picked = rng.sample(specs, 2)
+            name = f"{rng.choice(BRANDS)} {noun} {' '.join(picked)} {rng.randint(100, 999)}"
+            descr = (f"{picked[0]} {noun.lower()} with {picked[1]} "
+                     f"for {rng.choice(USES)}")
+            # Log-normal prices: many cheap items, a long tail of expensive ones
+            price = round(min(rng.lognormvariate(4.0, 1.0), 5000.0), 2) + 0.99
+            prices.append(price)
+            yield (pid, name, category, price, rng.randint(0, 500), descr)
+
+    counts['products'] = insert_batches(
+        conn, "INSERT INTO products VALUES (?, ?, ?, ?, ?, ?)", products(), args.batch)
+
+    # Sessions, most of them belonging to a few heavy customers
+    pick_customer = zipf_picker(rng, args.customers, args.skew)
+    session_keys = []      # (cid, sessionNo)
+    session_starts = []    # datetime
+    session_events = []    # events so far, used to make ts unique per session
+    next_session_no = {}
+    span = int((now - first_day).total_seconds())
+
+    def sessions():
+        starts = sorted(rng.randrange(span) for _ in range(args.sessions))
+        for offset in starts:
+            cid = pick_customer() + 1
+            session_no = next_session_no.get(cid, 0) + 1
+            next_session_no[cid] = session_no
+            start = first_day + timedelta(seconds=offset)
+            end = start + timedelta(seconds=rng.randint(60, 3600))
+            session_keys.append((cid, session_no))
+            session_starts.append(start)
+            session_events.append(0)
+            yield (cid, session_no, start.isoformat(), end.isoformat())
+
+    counts['sessions'] = insert_batches(
+        conn, "INSERT INTO sessions VALUES (?, ?, ?, ?)", sessions(), args.batch)
+
+    pick_product = zipf_picker(rng, args.products, args.skew)
+    pick_session = lambda: rng.randrange(len(session_keys))
+
+    def event_time(s):
+        # Every event in a session gets its own second, keeping (cid, sessionNo, ts) unique
+        session_events[s] += 1
+        return (session_starts[s] + timedelta(seconds=session_events[s])).isoformat()
+
+    # Searches, drawn from a small set of popular queries
+    query_pool = []
+    for category, (nouns, specs) in CATALOG.items():
+        for noun in nouns:
+            query_pool.append(noun.lower())
+            for spec in specs[:3]:
+                query_pool.append(f"{spec.lower()} {noun.lower()}")
+    pick_query = zipf_picker(rng, len(query_pool), args.skew)
+
+    def searches():
+        for _ in range(args.searches):
+            s = pick_session()
+            yield (*session_keys[s], event_time(s), query_pool[pick_query()])
+
+    counts['search'] = insert_batches(
+        conn, "INSERT INTO search VALUES (?, ?, ?, ?)", searches(), args.batch)
+
+    def views():
+        for _ in range(args.views):
+            s = pick_session()
+            yield (*session_keys[s], event_time(s), pick_product() + 1)
+
+    counts['viewedProduct'] = insert_batches(
+        conn, "INSERT INTO viewedProduct VALUES (?, ?, ?, ?)", views(), args.batch)
+
+    # Orders and their lines; small orders are far more common than big ones
+    order_lines = []
+
+    def orders():
+        for ono in range(1, args.orders + 1):
+            s = pick_session()
+            cid, session_no = session_keys[s]
+            odate = session_starts[s].date().isoformat()
+            lines = min(args.lines_per_order, int(rng.expovariate(0.5)) + 1)
+            order_lines.append((ono, lines))
+            yield (ono, cid, session_no, odate, f"{rng.randint(1, 9999)} Main St")
+
+    counts['orders'] = insert_batches(
+        conn, "INSERT INTO orders VALUES (?, ?, ?, ?, ?)", orders(), args.batch)
+
+    def orderlines():
+        for ono, lines in order_lines:
+            pids = set()
+            while len(pids) < lines:
+                pids.add(pick_product() + 1)
+            for line_no, pid in enumerate(pids, 1):
+                yield (ono, line_no, pid, rng.choice((1, 1, 1, 2, 3)), prices[pid - 1])
+
+    counts['orderlines'] = insert_batches(
+        conn, "INSERT INTO orderlines VALUES (?, ?, ?, ?, ?)", orderlines(), args.batch)
+
+    conn.commit()
+    load_time = time.perf_counter() - started
+
+    # Indexes, sequences, rollups, leaderboards, search index and ANALYZE
+    print("Running migrations...")
+    conn.execute("PRAGMA foreign_keys = ON")
+    version = migrate(conn)
+
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.close()
+
+    print(f"\n{'Table':<16}{'Rows':>12}")
+    for table, count in counts.items():
+        print(f"{table:<16}{count:>12,}")
+    print(f"{'Total':<16}{sum(counts.values()):>12,}")
+
+    print(f"\nLoaded in {load_time:.1f}s, "
+          f"{time.perf_counter() - started:.1f}s including indexes (schema version {version}).")
+    print("\nTest accounts:")
+    print("  Customer: uid=1, password=customer123")
+    print(f"  Sales:    uid={sales_uid}, password=sales456")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ drop table if exists cart;
 drop table if exists search;
 drop table if exists viewedProduct;
 drop table if exists sessions;
+drop table if exists products_fts;
 drop table if exists products;
 drop table if exists customers;
 drop table if exists users;
@@ -0,0 +1,154 @@
+import sqlite3
+import threading
+import time
+
+from autocomplete import tokens
+
+MIN_WORD = 3
+MIN_SIMILARITY = 0.35
+
+
+def trigrams(word):
+    """Trigrams of a word padded with spaces, so the ends count too"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SpellingIndex:
+    """In-memory trigram index over the words of product names, descriptions and categories
+
+    Used when a search finds nothing: each keyword that appears in no
+    product word is replaced by the most similar word (by trigram Jaccard
+    similarity). The work per keyword is bounded: trigrams shared by more
+    than max_postings words are skipped and at most max_candidates words
+    are scored. The index is built in a background thread, first when
+    refresh() is called and again whenever the catalog version has moved
+    (checked at most every refresh_interval seconds). Until a rebuild is
+    done the old index keeps answering, so a search never waits for one;
+    before the first build keywords are left as they are.
+    """
+
+    def __init__(self, db, refresh_interval=60.0, max_postings=500, max_candidates=200):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.max_postings = max_postings
+        self.max_candidates = max_candidates
+        self.lock = threading.Lock()
+
+        # (words, counts, postings) swapped in as a whole on rebuild
+        self.index = None
+        self.catalog_version = None
+        self.checked = 0.0
+        self.worker = None
+
+        self.corrections = 0
+        self.builds = 0
+        # Failed rebuilds, shown by stats(); the old index keeps answering
+        self.errors = 0
+        self.last_error = None
+
+    def correct(self, keywords):
+        """keywords with unknown ones replaced by their closest product word"""
+        self.refresh()
+        index = self.index
+        if index is None:
+            return tuple(keywords)
+        corrected = []
+        for keyword in keywords:
+            best = self.closest(index, keyword) if len(keyword) >= MIN_WORD else None
+            corrected.append(best or keyword)
+            if best:
+                self.corrections += 1
+        return tuple(corrected)
+
+    def closest(self, index, keyword):
+        """The most similar word, or None if keyword is already (part of) a word"""
+        words, counts, postings = index
+        grams = trigrams(keyword)
+
+        shared = {}
+        for gram in grams:
+            ids = postings.get(gram, ())
+            if len(ids) > self.max_postings:
+                continue
+            for word_id in ids:
+                shared[word_id] = shared.get(word_id, 0) + 1
+
+        # Search matches substrings, so a keyword inside a word is fine as it is
+        candidates = sorted(shared.items(), key=lambda item: -item[1])[:self.max_candidates]
+        best, best_score = None, MIN_SIMILARITY
+        for word_id, count in candidates:
+            word = words[word_id]
+            if keyword in word:
+                return None
+            score = count / (len(grams) + len(trigrams(word)) - count)
+            if score > best_score or (score == best_score and best is not None
+                                      and counts[word_id] > counts[best]):
+                best, best_score = word_id, score
+        return words[best] if best is not None else None
+
+    def refresh(self):
+        """Start a rebuild in the background if the catalog changed, never waits for it"""
+        if time.monotonic() - self.checked < self.refresh_interval:
+            return
+
+        with self.lock:
+            if time.monotonic() - self.checked < self.refresh_interval or self.building():
+                return
+            self.checked = time.monotonic()
+            version = self.db.query_one("SELECT version FROM catalog_version")[0]
+            if version == self.catalog_version:
+                return
+            self.worker = threading.Thread(target=self.rebuild, name="spelling-index",
+                                           daemon=True)
+            self.worker.start()
+
+    def building(self):
+        return self.worker is not None and self.worker.is_alive()
+
+    def rebuild(self):
+        try:
+            with self.db.reader() as conn:
+                # One read transaction, so the version matches the words read
+                conn.execute("BEGIN")
+                version = conn.execute("SELECT version FROM catalog_version").fetchone()[0]
+                index = self.build(conn)
+                conn.rollback()
+        except sqlite3.Error as e:
+            self.errors += 1
+            self.last_error = str(e)
+            return
+        self.index = index
+        self.catalog_version = version
+        self.builds += 1
+
+    def build(self, conn):
+        counts = {}
+        for row in conn.execute("SELECT name, descr, category FROM products"):
+            for word in set(tokens(row['name']) + tokens(row['descr']) + tokens(row['category'])):
+                if len(word) >= MIN_WORD:
+                    counts[word] = counts.get(word, 0) + 1
+
+        words = sorted(counts)
+        postings = {}
+        for word_id, word in enumerate(words):
+            for gram in trigrams(word):
+                postings.setdefault(gram, []).append(word_id)
+        return words, [counts[word] for word in words], postings
+
+    def close(self):
+        """Wait for a rebuild in progress, call before closing the database"""
+        worker = self.worker
+        if worker is not None:
+            worker.join()
+
+    def stats(self):
+        words, _, postings = self.index or ([], [], {})
+        return {
+            'words': len(words),
+            'trigrams': len(postings),
+            'corrections': self.corrections,
+            'builds': self.builds,
+            'errors': self.errors,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from database import Database
+from service import ShopService
+
+# Usage: python3 tests/bench_checkout.py [repeats]
+repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+cart_sizes = [1, 5, 10, 50, 100, 500]
+schema_file = Path(__file__).resolve().parent.parent / "setup" / "prj-tables.sql"
+
+tmp_dir = tempfile.mkdtemp()
+db_name = os.path.join(tmp_dir, "bench_checkout.db")
+
+# Fresh database with enough products for the largest cart
+conn = sqlite3.connect(db_name)
+with open(schema_file, "r", encoding="utf-8") as f:
+    conn.executescript(f.read())
+conn.execute("INSERT INTO users VALUES (1, 'pw', 'customer')")
+conn.execute("INSERT INTO customers VALUES (1, 'Bench User', 'bench@example.com')")
+conn.executemany(
+    "INSERT INTO products VALUES (?, ?, 'Bench', 9.99, 1000000, 'benchmark product')",
+    [(pid, f"Product {pid:05d}") for pid in range(1, max(cart_sizes) + 1)]
+)
+conn.commit()
+conn.close()
+
+db = Database(db_name)
+service = ShopService(db)
+session = service.start_session(1, 'customer', 1)
+cid = session.cid
+
+print("\n" + "="*60)
+print(f"CHECKOUT LATENCY ({repeats} orders per cart size)")
+print("="*60)
+print(f"{'Cart size':>10} {'mean ms':>10} {'p50 ms':>10} {'max ms':>10}")
+
+for size in cart_sizes:
+    timings = []
+    for _ in range(repeats):
+        with db.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO cart (cid, sessionNo, pid, qty) VALUES (?, ?, ?, 1)",
+                [(cid, session.session_no, pid) for pid in range(1, size + 1)]
+            )
+
+        start = time.perf_counter()
+        ono, total, failed = service.place_order(cid, session.session_no, "1 Bench Road")
+        timings.append((time.perf_counter() - start) * 1000)
+
+        if ono is None:
+            print(f"Checkout failed for cart size {size}: {len(failed)} line(s)")
+            sys.exit(1)
+
+    timings.sort()
+    mean = sum(timings) / len(timings)
+    print(f"{size:>10} {mean:>10.2f} {timings[len(timings) // 2]:>10.2f} {timings[-1]:>10.2f}")
+
+print("="*60 + "\n")
+
+service.close()
+db.close()
@@ -0,0 +1,84 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from database import Database
+from passwords import PasswordHasher
+from service import ShopService
+
+# Usage: python3 tests/bench_logins.py [logins per setting] [threads]
+#
+# Logins/sec through ShopService.login for each hashing cost, one login at
+# a time and with several threads logging in at once, plus the one-off cost
+# of upgrading a legacy plaintext password on first login.
+logins = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+settings = [
+    ('scrypt', 12), ('scrypt', 13), ('scrypt', 14), ('scrypt', 15),
+    ('pbkdf2_sha256', 100000), ('pbkdf2_sha256', 300000), ('pbkdf2_sha256', 600000),
+]
+schema_file = Path(__file__).resolve().parent.parent / "setup" / "prj-tables.sql"
+users = 20
+
+
+def make_db(path):
+    conn = sqlite3.connect(path)
+    with open(schema_file, "r", encoding="utf-8") as f:
+        conn.executescript(f.read())
+    conn.executemany("INSERT INTO users VALUES (?, ?, 'customer')",
+                     [(uid, f"pw{uid}") for uid in range(1, users + 1)])
+    conn.executemany("INSERT INTO customers VALUES (?, ?, ?)",
+                     [(uid, f"User {uid}", f"user{uid}@example.com")
+                      for uid in range(1, users + 1)])
+    conn.commit()
+    conn.close()
+
+
+def timed_login(service, uid):
+    start = time.perf_counter()
+    session = service.login(uid, f"pw{uid}")
+    elapsed = time.perf_counter() - start
+    if session is None:
+        raise RuntimeError(f"login failed for {uid}")
+    return elapsed
+
+
+print("\n" + "="*78)
+print(f"LOGIN THROUGHPUT ({logins} logins per run, {os.cpu_count()} cores)")
+print("="*78)
+print(f"{'Algorithm':<15}{'cost':>8}{'upgrade ms':>12}{'p50 ms':>10}"
+      f"{'1 thread/s':>12}{f'{threads} threads/s':>14}")
+
+tmp_dir = tempfile.mkdtemp()
+for algorithm, cost in settings:
+    db_name = os.path.join(tmp_dir, f"{algorithm}-{cost}.db")
+    make_db(db_name)
+
+    db = Database(db_name)
+    hasher = PasswordHasher(algorithm, cost)
+    service = ShopService(db, passwords=hasher)
+
+    # First logins find plaintext and store a hash at this cost
+    upgrades = [timed_login(service, uid) for uid in range(1, users + 1)]
+
+    start = time.perf_counter()
+    timings = sorted(timed_login(service, 1 + i % users) for i in range(logins))
+    sequential = logins / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda i: timed_login(service, 1 + i % users), range(logins)))
+    concurrent = logins / (time.perf_counter() - start)
+
+    print(f"{algorithm:<15}{cost:>8}{sum(upgrades) / users * 1000:>12.1f}"
+          f"{timings[len(timings) // 2] * 1000:>10.1f}{sequential:>12.1f}{concurrent:>14.1f}")
+
+    service.close()
+    db.close()
+
+print("="*78 + "\n")
@@ -0,0 +1,302 @@
+import argparse
+import json
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from database import Database
+from service import ShopService
+
+# Usage:
+#   python3 tests/bench_workflows.py --sizes small,medium --output results.json
+#   python3 tests/bench_workflows.py --db big.db --compare old.json
+#
+# Every customer and sales workflow is called on a ShopService, the same
+# engine the terminal menus use, and timed per call. sql/op is the number
+# of statements each call ran on this thread (Database.statement_count).
+# Generated databases are kept in --data-dir and reused on later runs,
+# each run works on a fresh copy since checkout and logins write to it.
+
+# Arguments for setup/generate_data.py
+SIZES = {
+    'small': dict(customers=1000, products=5000, sessions=10000, searches=20000,
+                  views=50000, orders=10000),
+    'medium': dict(customers=10000, products=50000, sessions=100000, searches=200000,
+                   views=500000, orders=100000),
+    'large': dict(customers=50000, products=200000, sessions=500000, searches=1000000,
+                  views=3000000, orders=500000),
+}
+
+OPERATIONS = ['login', 'search', 'add_to_cart', 'add_many_to_cart', 'checkout', 'view_orders',
+              'sales_report', 'top_products']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the shop workflows")
+    parser.add_argument("--sizes", default="small",
+                        help=f"comma separated, from {', '.join(SIZES)}")
+    parser.add_argument("--db", action="append", default=[],
+                        help="benchmark an existing database too (repeatable)")
+    parser.add_argument("--ops", type=int, default=200, help="timed calls per operation")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed calls per operation")
+    parser.add_argument("--seed", type=int, default=291)
+    parser.add_argument("--data-dir", default=str(Path(tempfile.gettempdir()) / "bench_workflows"))
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=20.0,
+                        help="percent p95 slowdown counted as a regression")
+    return parser.parse_args()
+
+
+def generated_db(size, seed, data_dir):
+    """Path of the pristine generated database for size, creating it if needed"""
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    path = data_dir / f"{size}-{seed}.db"
+    if not path.exists():
+        print(f"Generating {size} database...")
+        command = [sys.executable, str(ROOT / "setup" / "generate_data.py"),
+                   str(path) + ".tmp", f"--seed={seed}"]
+        command += [f"--{name}={value}" for name, value in SIZES[size].items()]
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        Path(str(path) + ".tmp").rename(path)
+    return path
+
+
+def percentile(timings, p):
+    """Nearest-rank percentile of a sorted list"""
+    index = max(0, min(len(timings) - 1, round(p / 100 * len(timings)) - 1))
+    return timings[index]
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    total = sum(timings)
+    return {
+        'n': len(timings),
+        'mean_ms': total / len(timings) * 1000,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'ops_per_sec': len(timings) / total if total else 0.0,
+    }
+
+
+def benchmark(db_name, ops, warmup, seed, trace=None):
+    rng = random.Random(seed)
+
+    # Sample accounts, products and queries to drive the workflows with
+    conn = sqlite3.connect(db_name)
+    customers = conn.execute(
+        "SELECT uid, pwd FROM users WHERE role = 'customer' LIMIT 500"
+    ).fetchall()
+    sales = conn.execute(
+        "SELECT uid, pwd FROM users WHERE role = 'sales' LIMIT 1"
+    ).fetchone()
+    pids = [row[0] for row in conn.execute(
+        "SELECT pid FROM products WHERE stock_count > 0 LIMIT 2000"
+    )]
+    queries = [row[0] for row in conn.execute(
+        "SELECT query FROM search GROUP BY query ORDER BY COUNT(*) DESC LIMIT 50"
+    )] or ['laptop', 'usb', 'wireless mouse', 'ram']
+    rows = sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+               for table in ('products', 'sessions', 'search', 'viewedProduct',
+                             'orders', 'orderlines'))
+    # Checkout mustn't run out of stock halfway through the run
+    conn.execute("UPDATE products SET stock_count = stock_count + 1000000")
+    conn.commit()
+    conn.close()
+
+    if not customers or not sales or not pids:
+        raise ValueError(f"{db_name} needs customers, a sales user and products in stock")
+
+    db = Database(db_name, trace=trace)
+    service = ShopService(db)
+    state = {'customer': None, 'sales': None}
+
+    # Each run_* does its setup outside the timer and returns the timed call
+    def customer():
+        uid, pwd = rng.choice(customers)
+        session = state['customer']
+        if session is None or session.uid != uid:
+            if session is not None:
+                service.logout(session)
+            state['customer'] = service.login(uid, pwd)
+        return state['customer']
+
+    def sales_user():
+        if state['sales'] is None:
+            state['sales'] = service.login(*sales)
+        return state['sales']
+
+    def run_login():
+        if state['customer'] is not None:
+            service.logout(state['customer'])
+            state['customer'] = None
+        uid, pwd = rng.choice(customers)
+        def call():
+            state['customer'] = service.login(uid, pwd)
+        return call
+
+    def run_search():
+        session = customer()
+        query = rng.choice(queries)
+        return lambda: service.search(session, query)
+
+    def run_add_to_cart():
+        session = customer()
+        pid = rng.choice(pids)
+        return lambda: service.add_to_cart(session, pid)
+
+    def run_add_many_to_cart():
+        session = customer()
+        items = [(pid, 1) for pid in rng.sample(pids, min(20, len(pids)))]
+        return lambda: service.add_many_to_cart(session, items)
+
+    def run_checkout():
+        session = customer()
+        for pid in rng.sample(pids, rng.randint(1, 5)):
+            service.add_to_cart(session, pid)
+        return lambda: service.checkout(session, "1 Bench Road")
+
+    def run_view_orders():
+        session = customer()
+        return lambda: service.list_orders(session)
+
+    def run_sales_report():
+        session = sales_user()
+        return lambda: service.sales_report(session)
+
+    def run_top_products():
+        session = sales_user()
+        return lambda: service.top_products(session)
+
+    prepare = {
+        'login': run_login,
+        'search': run_search,
+        'add_to_cart': run_add_to_cart,
+        'add_many_to_cart': run_add_many_to_cart,
+        'checkout': run_checkout,
+        'view_orders': run_view_orders,
+        'sales_report': run_sales_report,
+        'top_products': run_top_products,
+    }
+
+    results = {}
+    try:
+        for name in OPERATIONS:
+            timings = []
+            statements = 0
+            for i in range(warmup + ops):
+                call = prepare[name]()
+                count = db.statement_count()
+                start = time.perf_counter()
+                call()
+                elapsed = time.perf_counter() - start
+                if i >= warmup:
+                    timings.append(elapsed)
+                    statements += db.statement_count() - count
+            results[name] = summarize(timings)
+            results[name]['sql_per_op'] = statements / ops
+    finally:
+        service.close()
+        db.close()
+
+    return {'rows': rows, 'operations': results}
+
+
+def print_results(label, result):
+    print("\n" + "="*78)
+    print(f"{label} ({result['rows']:,} rows)")
+    print("="*78)
+    print(f"{'Operation':<18}{'n':>6}{'mean ms':>10}{'p50 ms':>10}"
+          f"{'p95 ms':>10}{'p99 ms':>10}{'ops/sec':>12}{'sql/op':>8}")
+    for name, r in result['operations'].items():
+        print(f"{name:<18}{r['n']:>6}{r['mean_ms']:>10.2f}{r['p50_ms']:>10.2f}"
+              f"{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['ops_per_sec']:>12.1f}"
+              f"{r.get('sql_per_op', 0):>8.1f}")
+
+
+def compare(old, new, threshold):
+    """Print p50/p95 changes against an earlier run, returns the regressions"""
+    regressions = []
+    print("\n" + "="*78)
+    print(f"COMPARED WITH {old.get('commit', '?')[:10]} ({old.get('timestamp', '?')})")
+    print("="*78)
+    for label, result in new['results'].items():
+        before = old['results'].get(label)
+        if not before:
+            continue
+        for name, r in result['operations'].items():
+            b = before['operations'].get(name)
+            if not b:
+                continue
+            p50 = (r['p50_ms'] - b['p50_ms']) / b['p50_ms'] * 100 if b['p50_ms'] else 0
+            p95 = (r['p95_ms'] - b['p95_ms']) / b['p95_ms'] * 100 if b['p95_ms'] else 0
+            flag = "  REGRESSION" if p95 > threshold else ""
+            print(f"{label:<10}{name:<18}p50 {p50:+7.1f}%   p95 {p95:+7.1f}%{flag}")
+            if flag:
+                regressions.append((label, name))
+    return regressions
+
+
+def main():
+    args = parse_args()
+
+    targets = []
+    for size in filter(None, args.sizes.split(",")):
+        if size not in SIZES:
+            print(f"Unknown size '{size}', choose from {', '.join(SIZES)}")
+            sys.exit(1)
+        targets.append((size, generated_db(size, args.seed, args.data_dir)))
+    targets += [(Path(db).name, Path(db)) for db in args.db]
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    report = {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'ops': args.ops,
+        'results': {},
+    }
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        for label, source in targets:
+            # Benchmark a copy, the runs add orders, sessions and cart rows
+            db_name = str(Path(work_dir) / f"{label}.db")
+            shutil.copyfile(source, db_name)
+            result = benchmark(db_name, args.ops, args.warmup, args.seed)
+            report['results'][label] = result
+            print_results(label, result)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        if compare(old, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
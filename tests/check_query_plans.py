@@ -0,0 +1,192 @@
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "tests"))
+from bench_workflows import benchmark
+from database import Database
+from query_stats import statement_shape
+from service import ShopService, SearchFilters
+import recommendations
+
+# Usage: python3 tests/check_query_plans.py [db_path]
+#
+# Runs the benchmark workflows and then every other ShopService call on a
+# copy of the database, collecting each statement they run through the
+# Database trace hook (values filled in), and prints EXPLAIN QUERY PLAN
+# for each distinct statement. Exits 1 if any of them reads a whole table
+# or index, other than the ones in ALLOWED_SCANS.
+#
+# Plans are made without the ANALYZE statistics: on a small database like
+# test.db those make the planner scan tables of a few rows, which hides
+# whether an index would be used once the table is big.
+
+# Scans that are there on purpose: (statement shape, scan line or None for
+# any, reason). Giving the scan line keeps the planner from quietly
+# switching to a worse index.
+ALLOWED_SCANS = [
+    (r"^SELECT version FROM catalog_version$", None, "one-row table"),
+    (r"recommendation_state", None, "one-row table"),
+    (r"FROM sqlite_master", None, "schema lookup at startup"),
+    (r"^SELECT k, v FROM \?\.\?$", None, "FTS5 reading its own config"),
+    (r"ORDER BY rowid DESC LIMIT \?", r"^SCAN (products|p)$",
+     "search index check, newest rows by rowid up to LIMIT"),
+    (r"^SELECT name, descr, category FROM products$", None, "building the spelling index"),
+    (r"^SELECT pid, name, category, price, stock_count, descr FROM products$", None,
+     "export of every product"),
+    (r"^SELECT category, COUNT\(\*\) AS count FROM products", r"COVERING INDEX",
+     "facets without a keyword count every product, only when the filter prompt opens"),
+    (r"^SELECT COUNT\(\*\) FROM \(.*stock_count > \?", r"COVERING INDEX idx_products_in_stock_",
+     "total of an in-stock-only search, from the in-stock index"),
+    (r"stock_count > \?\)+ ORDER BY", r"USING INDEX idx_products_in_stock_",
+     "first in-stock page, walks the in-stock index up to LIMIT"),
+]
+
+db_name = sys.argv[1] if len(sys.argv) > 1 else 'test.db'
+
+# statement shape -> first statement seen with that shape
+statements = {}
+
+
+def collect(sql):
+    head = sql.lstrip()[:8].upper()
+    if head.startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+        statements.setdefault(statement_shape(sql), sql)
+
+
+def tour(db_path):
+    """Call every ShopService workflow the benchmark doesn't"""
+    # Arguments for the calls, read outside the traced connections
+    conn = sqlite3.connect(db_path)
+    pids = [row[0] for row in conn.execute("SELECT pid FROM products LIMIT 3")]
+    category, name = conn.execute("SELECT category, name FROM products LIMIT 1").fetchone()
+    word = name.split()[0].lower()
+    sales_uid = conn.execute("SELECT uid FROM users WHERE role = 'sales'").fetchone()[0]
+    conn.close()
+
+    db = Database(db_path, trace=collect)
+    service = ShopService(db)
+    try:
+
+        uid = service.register("Plan Check", "plan.check@example.com", "pw")
+        session = service.login(uid, "pw")
+        service.spelling.close()
+
+        service.search(session, word)
+        service.search(session, word, page=1)
+        service.search(session, word + "qz")
+        service.search(session, word, filters=SearchFilters(category=category,
+                                                            sort='price_desc'))
+        service.search(session, "", filters=SearchFilters(min_price=10, max_price=100))
+        service.search(session, "", filters=SearchFilters(in_stock=True))
+        service.search(session, "", filters=SearchFilters(in_stock=True), page=1)
+        service.search_facets(session, word)
+        service.search_facets(session, "", SearchFilters(min_price=10))
+        service.suggest(session, word[:2])
+
+        service.view_product(session, pids[0])
+        service.also_bought(session, pids[0])
+        service.add_many_to_cart(session, [(pid, 1) for pid in pids])
+        service.update_cart_qty(session, pids[0], 2)
+        service.remove_from_cart(session, pids[1])
+        service.cart(session)
+        receipt = service.checkout(session, "1 Plan St")
+        service.list_orders(session)
+        service.order_detail(session, receipt.ono)
+        service.logout(session)
+
+        sales = service.start_session(sales_uid, 'sales', None)
+        service.product_info(sales, pids[0])
+        service.update_price(sales, pids[0], 9.99)
+        service.update_stock(sales, pids[0], 50)
+        export = str(Path(db_path).with_suffix(".csv"))
+        service.export_products(sales, export)
+        service.import_products(sales, export)
+        service.sales_report(sales)
+        service.top_products(sales)
+
+        service.sweeper.sweep()
+        with db.transaction() as conn:
+            recommendations.update(conn)
+    finally:
+        service.close()
+        db.close()
+
+
+def full_scans(plan):
+    """Plan lines reading a whole table or index"""
+    # Results of subqueries are already small, scanning them is expected
+    materialized = {detail.split()[1] for detail in plan if detail.startswith("MATERIALIZE")}
+    scans = []
+    for detail in plan:
+        if not detail.startswith("SCAN "):
+            continue
+        target = detail.split()[1]
+        if (target.startswith("(") or target == "CONSTANT" or target in materialized
+                or "VIRTUAL TABLE" in detail):
+            continue
+        scans.append(detail)
+    return scans
+
+
+work_dir = tempfile.mkdtemp()
+try:
+    copy = str(Path(work_dir) / "plans.db")
+    shutil.copyfile(db_name, copy)
+    # Migrate first, so the migrations' own statements aren't collected
+    Database(copy).close()
+    benchmark(copy, ops=5, warmup=0, seed=291, trace=collect)
+    tour(copy)
+
+    conn = sqlite3.connect(copy)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.execute("DROP TABLE IF EXISTS sqlite_stat1")
+    conn.execute("DROP TABLE IF EXISTS sqlite_stat4")
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(copy)
+
+    print("\n" + "="*70)
+    print(f"QUERY PLANS: {db_name} (schema version {version}, "
+          f"{len(statements)} distinct statements)")
+    print("="*70)
+
+    failures = []
+    for shape, sql in sorted(statements.items()):
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        scans = full_scans(plan)
+        print(f"\n{shape if len(shape) <= 200 else shape[:197] + '...'}")
+        unexpected = []
+        for detail in plan:
+            if detail not in scans:
+                print(f"  {detail}")
+                continue
+            allowed = next((reason for pattern, scan, reason in ALLOWED_SCANS
+                            if re.search(pattern, shape)
+                            and (scan is None or re.search(scan, detail))), None)
+            print(f"  {detail}   <-- {'allowed: ' + allowed if allowed else 'FULL SCAN'}")
+            if not allowed:
+                unexpected.append(detail)
+        if unexpected:
+            failures.append((shape, unexpected))
+    conn.close()
+finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+print("\n" + "="*70)
+if failures:
+    print(f"{len(failures)} statement(s) with full scans:")
+    for shape, scans in failures:
+        print(f"  - {shape[:100]}")
+        for detail in scans:
+            print(f"      {detail}")
+else:
+    print("No full scans.")
+print("="*70 + "\n")
+
+sys.exit(1 if failures else 0)
@@ -0,0 +1,85 @@
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from database import Database
+from service import ShopService
+import recommendations
+
+# Places orders on a copy of the database, folding them into the
+# recommendations incrementally after every few checkouts, and checks the
+# tables come out the same as a full rebuild each time.
+#
+#   python3 tests/check_recommendations.py [db_path] [orders]
+
+db_name = sys.argv[1] if len(sys.argv) > 1 else 'test.db'
+order_count = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+rng = random.Random(291)
+
+work_dir = tempfile.mkdtemp()
+copy = str(Path(work_dir) / "check_recommendations.db")
+shutil.copy(db_name, copy)
+
+db = Database(copy, readers=1)
+service = ShopService(db)
+
+
+def snapshot(conn):
+    return (conn.execute("SELECT pid, other, orders FROM co_purchases ORDER BY 1, 2").fetchall(),
+            conn.execute("SELECT pid, rank, other, score FROM recommendations ORDER BY 1, 2").fetchall())
+
+
+mismatches = 0
+try:
+    with db.transaction() as conn:
+        # Enough stock that every checkout goes through
+        conn.execute("UPDATE products SET stock_count = 1000000")
+    service.products.clear()
+
+    customers = [row[0] for row in db.query("SELECT cid FROM customers")]
+    pids = [row[0] for row in db.query("SELECT pid FROM products")]
+
+    print("\n" + "="*60)
+    print(f"RECOMMENDATIONS: incremental vs full rebuild ({db_name})")
+    print("="*60)
+
+    placed = 0
+    while placed < order_count:
+        # A few checkouts between updates, like the batch job would see
+        for _ in range(rng.randint(1, 5)):
+            cid = rng.choice(customers)
+            session = service.start_session(cid, 'customer', cid)
+            items = [(pid, rng.randint(1, 3))
+                     for pid in rng.sample(pids, rng.randint(1, min(4, len(pids))))]
+            service.add_many_to_cart(session, items)
+            service.checkout(session, "1 Check St")
+            service.logout(session)
+            placed += 1
+
+        with db.transaction() as conn:
+            orders, pairs = recommendations.update(conn)
+            incremental = snapshot(conn)
+        with db.transaction() as conn:
+            recommendations.update(conn, full=True)
+            full = snapshot(conn)
+            conn.rollback()
+
+        last = db.query_one("SELECT MAX(CAST(ono AS INTEGER)) FROM orders")[0]
+        same = incremental == full
+        mismatches += not same
+        print(f"  up to order {last}: {orders} new orders, {pairs} pairs - "
+              f"{'same' if same else 'DIFFERENT'}")
+finally:
+    service.close()
+    db.close()
+    shutil.rmtree(work_dir)
+
+print("="*60)
+print("Incremental matches full rebuild." if not mismatches
+      else f"{mismatches} update(s) differed from a full rebuild.")
+print("="*60 + "\n")
+sys.exit(1 if mismatches else 0)
@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Usage: python3 tests/load_http.py <database_file> [--sessions 300] [--duration 20]
+#
+# Starts server.py on a copy of the database and runs --sessions simulated
+# shoppers at once, each on its own keep-alive connection: log in, then
+# search, look at a product, add it to the cart, now and then check out or
+# list orders, until --duration seconds are up. Prints requests/sec and
+# latency percentiles per request type.
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test for server.py")
+    parser.add_argument("db_name")
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--workers", type=int, default=8, help="server thread pool size")
+    parser.add_argument("--think", type=float, default=0.0,
+                        help="seconds each shopper waits between requests")
+    parser.add_argument("--kdf-cost", type=int,
+                        help="password hashing cost passed on to the server")
+    parser.add_argument("--seed", type=int, default=291)
+    return parser.parse_args()
+
+
+class Client:
+    """Minimal keep-alive HTTP/1.1 JSON client"""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.token = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+
+    async def request(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(data)}\r\n"
+        if self.token:
+            head += f"Authorization: Bearer {self.token}\r\n"
+        self.writer.write(head.encode("latin-1") + b"\r\n" + data)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        payload = json.loads(await self.reader.readexactly(length)) if length else None
+        return status, payload
+
+    async def close(self):
+        self.writer.close()
+
+
+async def shopper(port, account, queries, deadline, think, rng, timings, statuses):
+    client = Client(port)
+    await client.connect()
+
+    async def call(name, method, path, body=None):
+        start = time.perf_counter()
+        status, payload = await client.request(method, path, body)
+        timings[name].append(time.perf_counter() - start)
+        statuses[status] += 1
+        if think:
+            await asyncio.sleep(rng.uniform(0, 2 * think))
+        return status, payload
+
+    status, payload = await call("login", "POST", "/login",
+                                 {"uid": str(account[0]), "pwd": account[1]})
+    if status != 200:
+        await client.close()
+        return
+    client.token = payload["token"]
+
+    while time.monotonic() < deadline:
+        query = rng.choice(queries).replace(" ", "+")
+        status, page = await call("search", "GET", f"/search?q={query}")
+        if status != 200 or not page["items"]:
+            continue
+        pid = rng.choice(page["items"])["pid"]
+        await call("view_product", "GET", f"/products/{pid}")
+        await call("add_to_cart", "POST", "/cart", {"pid": pid, "qty": 1})
+
+        roll = rng.random()
+        if roll < 0.15:
+            await call("cart", "GET", "/cart")
+            await call("checkout", "POST", "/checkout", {"address": "1 Load Test Way"})
+        elif roll < 0.25:
+            await call("list_orders", "GET", "/orders")
+
+    await call("logout", "POST", "/logout")
+    await client.close()
+
+
+def percentile(timings, p):
+    index = max(0, min(len(timings) - 1, round(p / 100 * len(timings)) - 1))
+    return timings[index] * 1000
+
+
+async def run_load(port, accounts, queries, args):
+    rng = random.Random(args.seed)
+    timings = defaultdict(list)
+    statuses = defaultdict(int)
+
+    start = time.monotonic()
+    deadline = start + args.duration
+    await asyncio.gather(*(
+        shopper(port, rng.choice(accounts), queries, deadline, args.think,
+                random.Random(rng.random()), timings, statuses)
+        for _ in range(args.sessions)
+    ))
+    return time.monotonic() - start, timings, statuses
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def main():
+    args = parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    db_name = str(Path(work_dir) / "load.db")
+    shutil.copyfile(args.db_name, db_name)
+
+    # Accounts and popular queries, and plenty of stock so checkouts succeed
+    conn = sqlite3.connect(db_name)
+    accounts = conn.execute(
+        "SELECT uid, pwd FROM users WHERE role = 'customer' LIMIT 1000"
+    ).fetchall()
+    queries = [row[0] for row in conn.execute(
+        "SELECT query FROM search GROUP BY query ORDER BY COUNT(*) DESC LIMIT 50"
+    )] or ['laptop', 'usb', 'wireless mouse', 'ram']
+    conn.execute("UPDATE products SET stock_count = stock_count + 1000000")
+    conn.commit()
+    conn.close()
+
+    port = free_port()
+    command = [sys.executable, str(ROOT / "server.py"), db_name, "--port", str(port),
+               "--workers", str(args.workers)]
+    if args.kdf_cost:
+        command += ["--kdf-cost", str(args.kdf_cost)]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        elapsed, timings, statuses = asyncio.run(run_load(port, accounts, queries, args))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    total = sum(len(t) for t in timings.values())
+    print("\n" + "="*70)
+    print(f"LOAD TEST: {args.sessions} sessions, {args.workers} workers, {elapsed:.1f}s")
+    print("="*70)
+    print(f"{'Request':<14}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/sec':>12}")
+    for name, values in sorted(timings.items()):
+        values.sort()
+        print(f"{name:<14}{len(values):>8}{percentile(values, 50):>10.2f}"
+              f"{percentile(values, 95):>10.2f}{percentile(values, 99):>10.2f}"
+              f"{len(values) / elapsed:>12.1f}")
+    print("-"*70)
+    print(f"{'total':<14}{total:>8}{'':>30}{total / elapsed:>12.1f}")
+    print(f"Status codes: {dict(sorted(statuses.items()))}")
+    print("="*70 + "\n")
+
+
+if __name__ == "__main__":
+    main()